@@ -25,6 +25,10 @@
 #define HEIGHT 96
 #define MAX_PIXELS 1000
 
+// 1 = send the run-length encoded frame format understood by receive.py
+// ('R' tag, <H width, <H height, <H run count, <H runs), 0 = raw bytes
+#define SEND_RLE 0
+
 void setup() {
   Serial.begin(921600);
   delay(2000);
@@ -101,11 +105,39 @@ void loop() {
 
   // Send to PC
   uint8_t sync[2] = {0xAA, 0x55};
+
+#if SEND_RLE
+  // Alternating 0/255 run lengths, starting with a run of zeros.
+  // At most WIDTH*HEIGHT + 1 runs, so uint16_t lengths always fit.
+  static uint16_t runs[WIDTH * HEIGHT + 1];
+  uint16_t run_count = 0;
+  uint16_t run_len = 0;
+  uint8_t current = 0;
+  for (int i = 0; i < fb->len; i++) {
+    if (binary[i] != current) {
+      runs[run_count++] = run_len;
+      run_len = 0;
+      current = binary[i];
+    }
+    run_len++;
+  }
+  runs[run_count++] = run_len;
+
+  uint8_t header[7] = {'R', WIDTH & 0xFF, WIDTH >> 8, HEIGHT & 0xFF, HEIGHT >> 8,
+                       (uint8_t)(run_count & 0xFF), (uint8_t)(run_count >> 8)};
+  uint32_t size = sizeof(header) + 2 * run_count;
+
+  Serial.write(sync, 2);
+  Serial.write((uint8_t*)&size, 4);
+  Serial.write(header, sizeof(header));
+  Serial.write((uint8_t*)runs, 2 * run_count);  // ESP32 is little-endian
+#else
   uint32_t size = fb->len;
 
   Serial.write(sync, 2);
   Serial.write((uint8_t*)&size, 4);
   Serial.write(binary, size);
+#endif
 
   esp_camera_fb_return(fb);
 
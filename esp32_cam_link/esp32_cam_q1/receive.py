@@ -1,56 +1,251 @@
 import serial
 import struct
+import sys
 import numpy as np
+from pathlib import Path
 from PIL import Image
 
+# Shared change detector in python/frame_gate.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "python"))
+from frame_gate import FrameChangeGate  # noqa: E402
+
 PORT = "COM4"
 BAUD = 921600
 
 WIDTH = 96
 HEIGHT = 96
 
-ser = serial.Serial(
-    PORT,
-    BAUD,
-    timeout=5,
-    dsrdtr=False,
-    rtscts=False
-)
-
-ser.setDTR(False)
-ser.setRTS(False)
-
-img_count = 0
-print("Receiving binary images... Press Ctrl+C to stop.")
-
-try:
-    while True:
-        # Sync
-        if ser.read(1) != b'\xAA':
-            continue
-        if ser.read(1) != b'\x55':
-            continue
-
-        # Length
-        size_bytes = ser.read(4)
-        size = struct.unpack("<I", size_bytes)[0]
-
-        # Data
-        data = ser.read(size)
-        if len(data) != size:
-            print("Incomplete frame")
-            continue
-
-        img = np.frombuffer(data, dtype=np.uint8)
-        img = img.reshape((HEIGHT, WIDTH))
-
-        image = Image.fromarray(img, mode='L')
-        filename = f"binary.png"
-        image.save(filename)
+# Append every received frame (compactly encoded) to this file, or None
+# Recordings use the same 0xAA 0x55 + <I length framing as the serial link
+RECORD_PATH = None
+RECORD_FORMAT = "auto"  # "auto", "bitmap", "rle" or "sparse"
+
+# Skip saving/recording frames that match the last processed frame
+CHANGE_GATE = True
+CHANGE_PIXELS = 16  # Pixels that must differ from the last saved mask
+
+SYNC = b'\xAA\x55'
+
+# ===== Compact binary frame formats =====
+# A raw frame is WIDTH*HEIGHT bytes of 0/255 (what the firmware sends today).
+# Encoded frames start with a tag byte that can never begin a raw frame,
+# followed by width and height as <H:
+#   'B' bitmap : packed 1 bit per pixel, row-major, MSB first
+#   'R' rle    : <H count, then count <H run lengths, alternating 0/255
+#                runs starting with a (possibly empty) run of zeros
+#   'S' sparse : <H count, then count <H flat indices (y * width + x)
+TAG_BITMAP = ord('B')
+TAG_RLE = ord('R')
+TAG_SPARSE = ord('S')
+
+FORMAT_TAGS = {"bitmap": TAG_BITMAP, "rle": TAG_RLE, "sparse": TAG_SPARSE}
+
+
+def _encode_bitmap(flat):
+    return np.packbits(flat).tobytes()
+
+
+def _encode_rle(flat):
+    # Run boundaries are the indices where the value changes
+    edges = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], edges, [flat.size]))
+    runs = np.diff(bounds)
+    if flat.size and flat[0]:
+        runs = np.concatenate(([0], runs))  # Always start with a zero run
+
+    # Split runs longer than 0xFFFF with empty runs of the opposite value
+    if runs.size and runs.max() > 0xFFFF:
+        split = []
+        for run in runs.tolist():
+            while run > 0xFFFF:
+                split.extend((0xFFFF, 0))
+                run -= 0xFFFF
+            split.append(run)
+        runs = np.array(split)
+
+    if runs.size > 0xFFFF:
+        raise ValueError("Too many runs for the RLE format")
+    return struct.pack("<H", runs.size) + runs.astype("<u2").tobytes()
+
+
+def _encode_sparse(flat):
+    idx = np.flatnonzero(flat)
+    return struct.pack("<H", idx.size) + idx.astype("<u2").tobytes()
+
+
+def encode_frame(mask, fmt="auto"):
+    """
+    Encode a binary (0/255) frame into one of the compact formats.
+    fmt="auto" picks whichever format is smallest for this frame.
+    """
+
+    mask = np.asarray(mask)
+    height, width = mask.shape
+    flat = (mask.ravel() != 0).astype(np.uint8)
+    header = struct.pack("<HH", width, height)
+
+    encoders = {
+        "bitmap": _encode_bitmap,
+        "rle": _encode_rle,
+    }
+    # Sparse indices and counts are <H, so only small frames qualify
+    if flat.size <= 0x10000 and flat.sum() <= 0xFFFF:
+        encoders["sparse"] = _encode_sparse
+
+    if fmt == "auto":
+        candidates = []
+        for name, enc in encoders.items():
+            try:
+                candidates.append(bytes([FORMAT_TAGS[name]]) + header + enc(flat))
+            except ValueError:
+                continue
+        return min(candidates, key=len)
+
+    if fmt not in encoders:
+        raise ValueError(f"Unsupported format for this frame: {fmt}")
+    return bytes([FORMAT_TAGS[fmt]]) + header + encoders[fmt](flat)
+
+
+def decode_frame(data, width=WIDTH, height=HEIGHT):
+    """
+    Decode a frame payload into a (height, width) uint8 array of 0/255.
+    Accepts the current raw frames as well as the compact formats.
+    """
+
+    # Raw frames: one byte per pixel, only ever 0 or 255
+    if len(data) == width * height and data[0] in (0, 255):
+        return np.frombuffer(data, dtype=np.uint8).reshape((height, width))
+
+    tag = data[0]
+    width, height = struct.unpack_from("<HH", data, 1)
+    body = memoryview(data)[5:]
+    n = width * height
+
+    if tag == TAG_BITMAP:
+        bits = np.unpackbits(np.frombuffer(body, dtype=np.uint8), count=n)
+        flat = bits * np.uint8(255)
+    elif tag == TAG_RLE:
+        count = struct.unpack_from("<H", body)[0]
+        runs = np.frombuffer(body, dtype="<u2", count=count, offset=2)
+        values = np.zeros(count, dtype=np.uint8)
+        values[1::2] = 255
+        flat = np.repeat(values, runs.astype(np.intp))
+    elif tag == TAG_SPARSE:
+        count = struct.unpack_from("<H", body)[0]
+        idx = np.frombuffer(body, dtype="<u2", count=count, offset=2)
+        flat = np.zeros(n, dtype=np.uint8)
+        flat[idx] = 255
+    else:
+        raise ValueError(f"Unknown frame format tag: {tag:#04x}")
 
+    if flat.size != n:
+        raise ValueError(f"Decoded {flat.size} pixels, expected {n}")
+    return flat.reshape((height, width))
+
+
+def read_frame(ser):
+    """
+    Read one framed payload (0xAA 0x55 + <I length + data).
+    Returns the payload bytes, or None if the frame was incomplete.
+    """
+
+    # Sync
+    if ser.read(1) != b'\xAA':
+        return None
+    if ser.read(1) != b'\x55':
+        return None
+
+    # Length
+    size_bytes = ser.read(4)
+    if len(size_bytes) != 4:
+        return None
+    size = struct.unpack("<I", size_bytes)[0]
+
+    # Data
+    data = ser.read(size)
+    if len(data) != size:
+        print("Incomplete frame")
+        return None
+
+    return data
+
+
+def write_frame(f, payload):
+    """Append one payload to a recording using the serial link framing."""
+    f.write(SYNC + struct.pack("<I", len(payload)) + payload)
+
+
+def open_serial():
+    # PORT may also be a pyserial URL, e.g. "socket://127.0.0.1:5555"
+    # for frame_simulator.py
+    ser = serial.serial_for_url(
+        PORT,
+        BAUD,
+        timeout=5,
+        dsrdtr=False,
+        rtscts=False
+    )
+
+    ser.setDTR(False)
+    ser.setRTS(False)
+    return ser
+
+
+def process_frame(data, gate=None, record=None, filename="binary.png"):
+    """
+    Decode, gate, save and record one payload.
+    Returns False if the frame was skipped as unchanged.
+    """
+
+    img = decode_frame(data)
+    if gate and not gate.check_mask(img):
+        print(f"Unchanged frame skipped ({gate.last_diff:.0f} pixels changed, "
+              f"{gate.skipped} skipped so far)")
+        return False
+
+    image = Image.fromarray(img, mode='L')
+    image.save(filename)
+
+    if record:
+        payload = encode_frame(img, RECORD_FORMAT)
+        write_frame(record, payload)
+        print(f"Saved {filename} (recorded {len(payload)} bytes, "
+              f"{img.size / len(payload):.1f}x smaller than raw)")
+    else:
         print(f"Saved {filename}")
-        img_count += 1
+    return True
+
+
+def main():
+    ser = open_serial()
+    record = open(RECORD_PATH, "ab") if RECORD_PATH else None
+
+    gate = FrameChangeGate(pixel_threshold=CHANGE_PIXELS) if CHANGE_GATE else None
+
+    img_count = 0
+    print("Receiving binary images... Press Ctrl+C to stop.")
+
+    try:
+        while True:
+            data = read_frame(ser)
+            if data is None:
+                continue
+
+            try:
+                if process_frame(data, gate, record):
+                    img_count += 1
+            except (ValueError, struct.error) as e:
+                print(f"Bad frame skipped: {e}")
+
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        if gate:
+            print(f"Frames: {gate.seen} received, {gate.skipped} unchanged skipped")
+        if record:
+            record.close()
+        ser.close()
+
 
-except KeyboardInterrupt:
-    print("\nStopped by user.")
-    ser.close()
+if __name__ == "__main__":
+    main()
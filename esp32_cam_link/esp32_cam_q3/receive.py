@@ -1,37 +1,67 @@
 import serial
 import struct
+import sys
+import io
+import time
+import queue
+import threading
+from pathlib import Path
+
+
+# Reuse the q3 reference resize (JPEG draft decode + nearest neighbor)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "python"))
+from q3 import load_jpeg_scaled  # noqa: E402
+from frame_gate import FrameChangeGate  # noqa: E402
 
 PORT = "COM4"
 BAUD = 921600
 
 # Simple receiver for ESP32 CAM resized images (upsampled or downsampled)
-# Just receives JPEG images and saves them
+# Frames flow through a staged pipeline so a slow disk never stalls reads:
+#   reader thread -> bounded frame queue -> worker pool -> bounded write queue
+#   -> writer thread
+# Both queues apply DROP_POLICY when full, so a slow disk drops frames
+# instead of growing memory.
+
+# ===== Pipeline configuration =====
+QUEUE_SIZE = 8               # Max frames waiting for a worker
+WRITE_QUEUE_SIZE = 8         # Max processed frames waiting for the writer
+DROP_POLICY = "drop-oldest"  # "drop-oldest" or "drop-newest" when queue is full
+NUM_WORKERS = 2              # Decode/resize worker threads
+WRITE_BATCH = 4              # Max files written per writer wake-up
+WRITE_BATCH_TIMEOUT = 0.5    # Seconds the writer waits to fill a batch
+STATS_INTERVAL = 5.0         # Seconds between metric reports
+
+# Optional PC-side resize of each received JPEG (None = save as received)
+RESIZE_SCALE_NUM = None
+RESIZE_SCALE_DEN = None
+
+OUTPUT_DIR = Path(".")
+SAVE_ALL_FRAMES = False      # False: overwrite resized.jpg like before
 
-ser = serial.Serial(
-    PORT,
-    BAUD,
-    timeout=5,
-    dsrdtr=False,
-    rtscts=False
-)
+# Drop frames that match the last processed frame before they are queued
+CHANGE_GATE = True
+CHANGE_THRESHOLD = 4.0       # Mean abs difference of the DCT-draft thumbnails (0..255)
 
-ser.setDTR(False)
-ser.setRTS(False)
+DROP_POLICIES = ("drop-oldest", "drop-newest")
 
-img_count = 0
-print("Waiting for frames from ESP32 CAM...")
 
-while True:
+def read_frame(ser):
+    """
+    Read one framed JPEG (0xAA 0x55 + <I length + data).
+    Returns the payload bytes, or None if no complete frame was read.
+    """
+
     # Find sync word (0xAA 0x55)
     if ser.read(1) != b'\xAA':
-        continue
+        return None
     if ser.read(1) != b'\x55':
-        continue
+        return None
 
     # Read image size (4 bytes, little-endian)
     size_bytes = ser.read(4)
     if len(size_bytes) != 4:
-        continue
+        return None
 
     size = struct.unpack("<I", size_bytes)[0]
 
@@ -39,11 +69,246 @@ while True:
     data = ser.read(size)
     if len(data) != size:
         print("Incomplete frame")
-        continue
+        return None
+
+    return data
+
+
+class FrameQueue:
+    """
+    Bounded queue whose put() never blocks.
+    When full, either the oldest queued frame or the new frame is dropped.
+    Tracks drops and queue depth for the metric reports.
+    """
+
+    def __init__(self, maxsize, drop_policy="drop-oldest"):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {DROP_POLICIES}")
+        self.queue = queue.Queue(maxsize)
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self.max_depth = 0
+        self._depth_sum = 0
+        self._depth_samples = 0
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                break
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+                if self.drop_policy == "drop-newest":
+                    return
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+        depth = self.queue.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_sum += depth
+            self._depth_samples += 1
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+    def depth_stats(self):
+        with self._lock:
+            mean = self._depth_sum / self._depth_samples if self._depth_samples else 0.0
+            return {
+                "depth": self.queue.qsize(),
+                "max_depth": self.max_depth,
+                "mean_depth": mean,
+                "dropped": self.dropped,
+            }
+
+
+class ReceivePipeline:
+    """
+    reader -> FrameQueue -> NUM_WORKERS decode/resize workers -> FrameQueue -> writer.
+
+    The reader only drains the port; all decoding, resizing and disk I/O
+    happen on other threads, so reads never wait for the disk.
+    """
+
+    def __init__(self, source, queue_size=QUEUE_SIZE, drop_policy=DROP_POLICY,
+                 num_workers=NUM_WORKERS, write_batch=WRITE_BATCH,
+                 write_queue_size=WRITE_QUEUE_SIZE,
+                 scale_num=RESIZE_SCALE_NUM, scale_den=RESIZE_SCALE_DEN,
+                 output_dir=OUTPUT_DIR, save_all=SAVE_ALL_FRAMES,
+                 change_gate=CHANGE_GATE, change_threshold=CHANGE_THRESHOLD):
+        self.source = source
+        self.frames = FrameQueue(queue_size, drop_policy)
+        self.results = FrameQueue(write_queue_size, drop_policy)
+        self.num_workers = num_workers
+        self.write_batch = write_batch
+        self.scale_num = scale_num
+        self.scale_den = scale_den
+        self.output_dir = Path(output_dir)
+        self.save_all = save_all
+        self.gate = FrameChangeGate(change_threshold) if change_gate else None
+
+        self.stop_event = threading.Event()
+        self.counts = {"read": 0, "processed": 0, "written": 0, "errors": 0,
+                       "unchanged": 0}
+        self._count_lock = threading.Lock()
+        self._threads = []
+
+    def _count(self, key, n=1):
+        with self._count_lock:
+            self.counts[key] += n
+
+    # ----- Stages -----
+    def _reader(self):
+        frame_no = 0
+        while not self.stop_event.is_set():
+            data = read_frame(self.source)
+            if data is None:
+                continue
+            frame_no += 1
+            self._count("read")
+            if self.gate and not self._changed(data):
+                self._count("unchanged")
+                continue
+            self.frames.put((frame_no, data))
+
+    def _changed(self, data):
+        try:
+            return self.gate.check_jpeg(data)
+        except Exception:
+            # Let the worker report corrupt frames
+            return True
+
+    def _worker(self):
+        while not self.stop_event.is_set():
+            try:
+                frame_no, data = self.frames.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                self.results.put(self.process(frame_no, data))
+                self._count("processed")
+            except Exception as e:
+                self._count("errors")
+                print(f"Frame #{frame_no} failed: {e}")
+
+    def _writer(self):
+        while not (self.stop_event.is_set() and self.results.queue.empty()):
+            batch = []
+            deadline = time.monotonic() + WRITE_BATCH_TIMEOUT
+            while len(batch) < self.write_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.results.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            for files in batch:
+                for path, payload in files:
+                    with open(path, "wb") as f:
+                        f.write(payload)
+                    print(f"Saved {path} ({len(payload)} bytes)")
+            self._count("written", len(batch))
+
+    # ----- Per-frame work -----
+    def output_name(self, frame_no, suffix=""):
+        if self.save_all:
+            return self.output_dir / f"resized_{frame_no:05d}{suffix}"
+        return self.output_dir / f"resized{suffix}"
+
+    def process(self, frame_no, data):
+        """Return the (path, bytes) files to write for one frame."""
+        files = [(self.output_name(frame_no, ".jpg"), data)]
+
+        if self.scale_num and self.scale_den:
+            # Downscales decode in the DCT domain where possible
+            resized = load_jpeg_scaled(io.BytesIO(data), self.scale_num, self.scale_den)
+            buf = io.BytesIO()
+            resized.save(buf, format="PNG")
+            files.append((self.output_name(frame_no, "_pc.png"), buf.getvalue()))
+
+        return files
+
+    # ----- Control -----
+    def start(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._threads = [threading.Thread(target=self._reader, name="reader", daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._worker, name=f"worker-{i}", daemon=True)
+            for i in range(self.num_workers)
+        ]
+        self._threads.append(threading.Thread(target=self._writer, name="writer", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def stats(self):
+        with self._count_lock:
+            stats = dict(self.counts)
+        stats.update(self.frames.depth_stats())
+        writes = self.results.depth_stats()
+        stats["pending_writes"] = writes["depth"]
+        stats["max_pending_writes"] = writes["max_depth"]
+        stats["dropped_writes"] = writes["dropped"]
+        stats["dropped"] += writes["dropped"]
+        return stats
+
+
+def format_stats(stats):
+    return (f"read={stats['read']} processed={stats['processed']} "
+            f"written={stats['written']} unchanged={stats['unchanged']} "
+            f"dropped={stats['dropped']} "
+            f"errors={stats['errors']} | queue depth={stats['depth']} "
+            f"max={stats['max_depth']} mean={stats['mean_depth']:.2f} "
+            f"| pending writes={stats['pending_writes']} "
+            f"max={stats['max_pending_writes']} dropped={stats['dropped_writes']}")
+
+
+def open_serial():
+    # PORT may also be a pyserial URL, e.g. "socket://127.0.0.1:5555"
+    # for frame_simulator.py
+    ser = serial.serial_for_url(
+        PORT,
+        BAUD,
+        timeout=5,
+        dsrdtr=False,
+        rtscts=False
+    )
+
+    ser.setDTR(False)
+    ser.setRTS(False)
+    return ser
+
+
+def main():
+    ser = open_serial()
+    pipeline = ReceivePipeline(ser)
+
+    print("Waiting for frames from ESP32 CAM...")
+    print(f"Queue size {QUEUE_SIZE} (writes {WRITE_QUEUE_SIZE}), policy {DROP_POLICY}, "
+          f"{NUM_WORKERS} workers")
+    pipeline.start()
+
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            print(format_stats(pipeline.stats()))
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        pipeline.stop()
+        ser.close()
+        print(format_stats(pipeline.stats()))
 
-    img_count += 1
-    filename = f"resized.jpg"
-    with open(filename, "wb") as f:
-        f.write(data)
 
-    print(f"Saved {filename} ({size} bytes) - Frame #{img_count}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Synthetic ESP32 CAM frame source for load testing the receivers
+
+USAGE:
+    python frame_simulator.py --transport tcp --kind q3 --fps 20
+        -> set PORT = "socket://127.0.0.1:5555" in esp32_cam_q3/receive.py
+    python frame_simulator.py --transport pty --kind q1 --fps 5 --corrupt 0.05
+        -> prints the pty device to use as PORT (Linux/macOS)
+
+    Frames use the exact link framing of esp32_cam_q1.ino / esp32_cam_q3.ino:
+    0xAA 0x55 + <I little-endian length + payload.
+      q1: WIDTH*HEIGHT raw bytes of 0/255 (96x96 by default)
+      q3: baseline JPEG (160x120 by default)
+    A bright square moves across the frame so every frame differs.
+
+    --burst N sends N frames back to back and then pauses, keeping the
+    mean rate at --fps. --corrupt P damages a fraction P of the frames
+    (flipped payload bytes, a truncated payload or a broken sync word).
+"""
+
+import io
+import os
+import time
+import socket
+import random
+import struct
+import argparse
+import threading
+
+import numpy as np
+from PIL import Image
+
+# ===== Configuration =====
+KIND = "q3"               # "q1" (binary frames) or "q3" (JPEG frames)
+FPS = 1.0                 # Mean frame rate (the real boards send about 1 frame/s)
+BURST = 1                 # Frames per burst
+CORRUPT_RATE = 0.0        # Fraction of frames that get damaged
+JPEG_QUALITY = 80
+NUM_VARIANTS = 32         # Distinct pre-rendered frames cycled through
+SEED = 0
+
+HOST = "127.0.0.1"
+TCP_PORT = 5555
+
+DEFAULT_SIZES = {"q1": (96, 96), "q3": (160, 120)}
+SYNC = b'\xAA\x55'
+CORRUPTIONS = ("flip", "truncate", "sync")
+# ===== End Configuration =====
+
+
+def frame_bytes(payload):
+    return SYNC + struct.pack("<I", len(payload)) + payload
+
+
+def render_payloads(kind=KIND, size=None, count=NUM_VARIANTS, quality=JPEG_QUALITY, seed=SEED):
+    """Pre-render count payloads (a square moving over a noisy background)."""
+    width, height = size or DEFAULT_SIZES[kind]
+    rng = np.random.default_rng(seed)
+    side = max(min(width, height) // 4, 1)
+
+    payloads = []
+    for i in range(count):
+        x = (i * width // count) % max(width - side, 1)
+        y = (i * height // count) % max(height - side, 1)
+        if kind == "q1":
+            frame = np.zeros((height, width), dtype=np.uint8)
+            frame[y:y + side, x:x + side] = 255
+            payloads.append(frame.tobytes())
+        else:
+            frame = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+            frame[y:y + side, x:x + side] = 230
+            buf = io.BytesIO()
+            Image.fromarray(frame).save(buf, format="JPEG", quality=quality)
+            payloads.append(buf.getvalue())
+    return payloads
+
+
+class FrameSimulator:
+    """
+    Writes framed payloads to send(bytes) at a mean rate of fps.
+    Counts what was sent so a harness can compute loss.
+    """
+
+    def __init__(self, send, payloads, fps=FPS, burst=BURST,
+                 corrupt_rate=CORRUPT_RATE, seed=SEED):
+        self.send = send
+        self.payloads = payloads
+        self.fps = fps
+        self.burst = max(int(burst), 1)
+        self.corrupt_rate = corrupt_rate
+        self.rng = random.Random(seed)
+
+        self.stop_event = threading.Event()
+        self.sent = 0
+        self.corrupted = 0
+        self.truncated = 0  # Truncated frames also swallow the frame after them
+        self.bytes_sent = 0
+
+    def _corrupt(self, data):
+        kind = self.rng.choice(CORRUPTIONS)
+        data = bytearray(data)
+        if kind == "flip":
+            for _ in range(self.rng.randint(1, 8)):
+                i = self.rng.randrange(6, len(data))
+                data[i] ^= 1 << self.rng.randrange(8)
+        elif kind == "truncate":
+            del data[self.rng.randrange(6, len(data)):]
+            self.truncated += 1
+        else:
+            data[1] = 0x00  # Receiver must resync on the next frame
+        return bytes(data)
+
+    def run(self, duration=None, count=None):
+        """Send until duration seconds, count frames, or stop()."""
+        interval = self.burst / self.fps if self.fps else 0.0
+        start = time.perf_counter()
+        next_burst = start
+        i = 0
+
+        while not self.stop_event.is_set():
+            if duration is not None and time.perf_counter() - start >= duration:
+                break
+            for _ in range(self.burst):
+                if count is not None and self.sent >= count:
+                    return
+                data = frame_bytes(self.payloads[i % len(self.payloads)])
+                i += 1
+                if self.corrupt_rate and self.rng.random() < self.corrupt_rate:
+                    data = self._corrupt(data)
+                    self.corrupted += 1
+                try:
+                    self.send(data)
+                except OSError:
+                    return  # Receiver went away
+                self.sent += 1
+                self.bytes_sent += len(data)
+
+            next_burst += interval
+            delay = next_burst - time.perf_counter()
+            if delay > 0:
+                self.stop_event.wait(delay)
+
+    def stop(self):
+        self.stop_event.set()
+
+# ===== Transports =====
+def open_pty():
+    """Return (master_fd, device_name); the receiver opens device_name as PORT."""
+    import pty
+    import tty
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)  # Binary-safe: no newline translation or echo
+    return master, os.ttyname(slave)
+
+
+def pty_sender(master):
+    def send(data):
+        view = memoryview(data)
+        while view:
+            n = os.write(master, view)
+            view = view[n:]
+    return send
+
+
+def tcp_listener(host=HOST, port=TCP_PORT):
+    """Listening socket; port 0 picks a free port (see getsockname())."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(1)
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic ESP32 CAM frame source")
+    parser.add_argument("--transport", choices=("tcp", "pty"), default="tcp")
+    parser.add_argument("--kind", choices=("q1", "q3"), default=KIND)
+    parser.add_argument("--fps", type=float, default=FPS)
+    parser.add_argument("--burst", type=int, default=BURST)
+    parser.add_argument("--corrupt", type=float, default=CORRUPT_RATE)
+    parser.add_argument("--width", type=int)
+    parser.add_argument("--height", type=int)
+    parser.add_argument("--duration", type=float, help="seconds to run (default: forever)")
+    parser.add_argument("--port", type=int, default=TCP_PORT)
+    args = parser.parse_args(argv)
+
+    size = None
+    if args.width or args.height:
+        default_w, default_h = DEFAULT_SIZES[args.kind]
+        size = (args.width or default_w, args.height or default_h)
+    payloads = render_payloads(args.kind, size)
+    print(f"{args.kind} frames: {len(payloads[0])}-{max(map(len, payloads))} bytes, "
+          f"{args.fps} fps, burst {args.burst}, corrupt {args.corrupt:.0%}")
+
+    conn = master = None
+    if args.transport == "pty":
+        master, name = open_pty()
+        print(f"Set PORT = \"{name}\" in receive.py")
+        send = pty_sender(master)
+    else:
+        server = tcp_listener(HOST, args.port)
+        print(f"Set PORT = \"socket://{HOST}:{args.port}\" in receive.py, waiting...")
+        conn, _ = server.accept()
+        server.close()
+        send = conn.sendall
+
+    sim = FrameSimulator(send, payloads, args.fps, args.burst, args.corrupt)
+    try:
+        sim.run(args.duration)
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        if conn:
+            conn.close()
+        if master is not None:
+            os.close(master)
+        print(f"Sent {sim.sent} frames ({sim.corrupted} corrupted, {sim.bytes_sent} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Soak test for the ESP32 CAM receivers
+
+USAGE:
+    python soak_test.py --receiver q3
+    python soak_test.py --receiver q1 --rates 5 20 100 --corrupt 0.02
+
+    For every rate in RATES, frame_simulator.py streams frames over a local
+    TCP socket (opened by the receiver as "socket://..." exactly like a COM
+    port) for STEP_SECONDS, then the receiver gets DRAIN_SECONDS to finish.
+      q1: read_frame + process_frame from esp32_cam_q1/receive.py
+      q3: ReceivePipeline from esp32_cam_q3/receive.py (change gate off)
+    Output files go to a temporary folder; receiver prints are silenced.
+
+    Reported per rate: offered/sent/delivered fps, loss rate and process
+    memory (RSS) growth. Frames damaged on purpose (--corrupt) are not
+    the receiver's fault: "Loss" is measured against the frames that
+    could be delivered (sent minus corrupted, minus the frame each
+    truncated frame swallows), "Raw" against everything sent. The
+    saturation point is the first rate where the receiver delivers less
+    than SATURATION_RATIO of the deliverable rate or loses more than
+    LOSS_LIMIT of the deliverable frames.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+import importlib.util
+from pathlib import Path
+
+import serial
+
+from frame_simulator import FrameSimulator, render_payloads, tcp_listener
+
+# Shared measurement helpers live in python/, next to the q1/q3 modules
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "python"))
+from perf_stats import rss_bytes  # noqa: E402
+
+# ===== Configuration =====
+RATES = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]  # Offered frames per second
+STEP_SECONDS = 3.0
+DRAIN_SECONDS = 1.0
+LOSS_LIMIT = 0.01         # Loss rate that counts as saturated
+SATURATION_RATIO = 0.95   # Delivered / offered rate below this is saturated
+READ_TIMEOUT = 0.5        # Receiver-side serial timeout during the test
+# ===== End Configuration =====
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+def load_receiver(kind):
+    """Import esp32_cam_<kind>/receive.py under a unique module name."""
+    path = BASE_DIR / f"esp32_cam_{kind}" / "receive.py"
+    spec = importlib.util.spec_from_file_location(f"receive_{kind}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ===== Receiver drivers =====
+def _drive_q1(module, ser, out_dir, stop_event, counts):
+    filename = str(Path(out_dir) / "binary.png")
+    while not stop_event.is_set():
+        data = module.read_frame(ser)
+        if data is None:
+            continue
+        counts["read"] += 1
+        try:
+            module.process_frame(data, filename=filename)
+            counts["delivered"] += 1
+        except Exception:
+            counts["errors"] += 1
+
+
+def run_step(module, kind, payloads, fps, seconds=STEP_SECONDS,
+             burst=1, corrupt_rate=0.0):
+    """Stream frames at fps for `seconds` into one receiver; return the stats."""
+    server = tcp_listener(port=0)
+    port = server.getsockname()[1]
+    sim_box = {}
+
+    def simulate():
+        conn, _ = server.accept()
+        sim = sim_box["sim"] = FrameSimulator(conn.sendall, payloads, fps, burst, corrupt_rate)
+        # pyserial flushes the input buffer while opening the port
+        sim_box["opened"].wait()
+        try:
+            sim.run(duration=seconds)
+        finally:
+            sim_box["end"] = time.perf_counter()
+            sim_box["sent"].set()
+            # Keep the link up until the receiver stops (a closed socket
+            # is a read error, a quiet serial port is not)
+            sim_box["release"].wait()
+            conn.close()
+            server.close()
+
+    sim_box["opened"] = threading.Event()
+    sim_box["sent"] = threading.Event()
+    sim_box["release"] = threading.Event()
+    sim_thread = threading.Thread(target=simulate, name="simulator", daemon=True)
+    sim_thread.start()
+
+    ser = serial.serial_for_url(f"socket://127.0.0.1:{port}", timeout=READ_TIMEOUT)
+
+    out_dir = tempfile.mkdtemp(prefix=f"soak_{kind}_")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if kind == "q1":
+            counts = {"read": 0, "delivered": 0, "errors": 0}
+            stop_event = threading.Event()
+            worker = threading.Thread(target=_drive_q1, daemon=True,
+                                      args=(module, ser, out_dir, stop_event, counts))
+            worker.start()
+            start = time.perf_counter()
+            sim_box["opened"].set()
+            sim_box["sent"].wait()
+            time.sleep(DRAIN_SECONDS)
+            stop_event.set()
+            worker.join(READ_TIMEOUT * 4)
+            dropped = 0
+        else:
+            pipeline = module.ReceivePipeline(ser, output_dir=out_dir, change_gate=False)
+            pipeline.start()
+            start = time.perf_counter()
+            sim_box["opened"].set()
+            sim_box["sent"].wait()
+            time.sleep(DRAIN_SECONDS)
+            pipeline.stop()
+            stats = pipeline.stats()
+            counts = {"read": stats["read"], "delivered": stats["written"],
+                      "errors": stats["errors"]}
+            dropped = stats["dropped"]
+    sim_box["release"].set()
+    sim_thread.join()
+    ser.close()
+
+    sim = sim_box["sim"]
+    elapsed = sim_box["end"] - start
+    sent = sim.sent
+    deliverable = max(sent - sim.corrupted - sim.truncated, 0)
+    return {
+        "offered_fps": fps,
+        "sent": sent,
+        "sent_fps": sent / elapsed if elapsed else 0.0,
+        "read": counts["read"],
+        "delivered": counts["delivered"],
+        "delivered_fps": counts["delivered"] / elapsed if elapsed else 0.0,
+        "dropped": dropped,
+        "errors": counts["errors"],
+        "corrupted": sim.corrupted,
+        "deliverable": deliverable,
+        # Corrupted frames that still decode can push delivered above deliverable
+        "loss": max(1 - counts["delivered"] / deliverable, 0.0) if deliverable else 0.0,
+        "raw_loss": 1 - counts["delivered"] / sent if sent else 0.0,
+    }
+
+
+def is_saturated(step):
+    # Offered rate scaled to the share of frames that could be delivered
+    expected_fps = step["offered_fps"] * (step["deliverable"] / step["sent"] if step["sent"] else 1)
+    return (step["delivered_fps"] < SATURATION_RATIO * expected_fps
+            or step["loss"] > LOSS_LIMIT)
+
+
+def soak(kind, rates=RATES, seconds=STEP_SECONDS, burst=1, corrupt_rate=0.0,
+         size=None, stop_at_saturation=True):
+    module = load_receiver(kind)
+    payloads = render_payloads(kind, size)
+    baseline = rss_bytes()
+
+    print(f"Receiver {kind}: {len(payloads[0])}-byte frames, {seconds:.0f} s per rate, "
+          f"burst {burst}, corrupt {corrupt_rate:.0%}")
+    print(f"{'Offered':>8}{'Sent/s':>9}{'Deliv/s':>9}{'Sent':>7}{'Deliv':>7}"
+          f"{'Corr':>6}{'Drop':>6}{'Err':>5}{'Loss':>8}{'Raw':>8}{'RSS MB':>9}{'dRSS MB':>9}")
+    print("-" * 91)
+
+    steps = []
+    saturation = None
+    for fps in rates:
+        step = run_step(module, kind, payloads, fps, seconds, burst, corrupt_rate)
+        step["rss"] = rss_bytes()
+        step["rss_growth"] = step["rss"] - baseline
+        steps.append(step)
+
+        print(f"{fps:>8g}{step['sent_fps']:>9.1f}{step['delivered_fps']:>9.1f}"
+              f"{step['sent']:>7}{step['delivered']:>7}{step['corrupted']:>6}"
+              f"{step['dropped']:>6}{step['errors']:>5}{step['loss']:>7.1%}"
+              f"{step['raw_loss']:>7.1%}{step['rss'] / 1e6:>9.1f}"
+              f"{step['rss_growth'] / 1e6:>9.1f}")
+
+        if saturation is None and is_saturated(step):
+            saturation = fps
+            if stop_at_saturation:
+                break
+
+    print("-" * 91)
+    if saturation is None:
+        print(f"No saturation up to {rates[-1]} fps")
+    else:
+        sustained = [s["offered_fps"] for s in steps if not is_saturated(s)]
+        best = f"{max(sustained):g} fps" if sustained else "none"
+        print(f"Saturation at {saturation:g} fps (highest sustained rate: {best})")
+    print(f"Memory growth over the soak: {(steps[-1]['rss'] - baseline) / 1e6:.1f} MB")
+    return steps, saturation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak test for the ESP32 CAM receivers")
+    parser.add_argument("--receiver", choices=("q1", "q3"), default="q3")
+    parser.add_argument("--rates", type=float, nargs="+", default=RATES)
+    parser.add_argument("--seconds", type=float, default=STEP_SECONDS)
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--corrupt", type=float, default=0.0)
+    parser.add_argument("--all-rates", action="store_true",
+                        help="keep going after the saturation point")
+    args = parser.parse_args(argv)
+
+    soak(args.receiver, args.rates, args.seconds, args.burst, args.corrupt,
+         stop_at_saturation=not args.all_rates)
+
+
+if __name__ == "__main__":
+    main()
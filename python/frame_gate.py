@@ -0,0 +1,115 @@
+import io
+import numpy as np
+from PIL import Image
+
+# ===== Configuration =====
+THUMB_SIZE = (16, 12)  # Thumbnail (width, height) compared between frames
+CHANGE_THRESHOLD = 4.0  # Mean absolute thumbnail difference (gray levels 0..255)
+MASK_CHANGE_PIXELS = 16  # Binary (q1) masks: changed pixels that count as a change
+MAX_SKIPPED = 0  # Force a frame through after this many skips (0 = never)
+# ===== End Configuration =====
+
+# Set bits per byte value, for counting changed mask pixels
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def thumbnail_from_array(gray, size=THUMB_SIZE):
+    """
+    Block-mean thumbnail of a (H, W) uint8 gray frame. Not for sparse
+    0/255 masks: a small object barely moves a block mean (see pack_mask).
+    Edge rows/columns that do not fill a whole block are ignored.
+    """
+
+    gray = np.asarray(gray)
+    if gray.ndim == 3:
+        gray = gray.mean(axis=2)
+    thumb_w, thumb_h = size
+    h, w = gray.shape
+    by, bx = max(h // thumb_h, 1), max(w // thumb_w, 1)
+    rows, cols = h // by, w // bx
+    blocks = gray[:rows * by, :cols * bx].reshape(rows, by, cols, bx)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def thumbnail_from_jpeg(data, size=THUMB_SIZE):
+    """
+    Thumbnail of a JPEG frame without a full decode: the decoder reduces
+    the image by up to 1/8 in the DCT domain (Image.draft) in grayscale.
+    """
+
+    image = Image.open(io.BytesIO(data))
+    image.draft("L", size)
+    image = image.convert("L")
+    return thumbnail_from_array(np.asarray(image), size)
+
+
+def pack_mask(mask):
+    """Binary (H, W) frame -> (H, ceil(W/8)) packed bits, 1 = nonzero pixel."""
+    return np.packbits(np.asarray(mask) != 0, axis=1)
+
+
+def mask_difference(a, b):
+    """Number of pixels that differ between two packed masks."""
+    return int(POPCOUNT[np.bitwise_xor(a, b)].sum(dtype=np.int64))
+
+
+def thumbnail_difference(a, b):
+    return float(np.abs(a - b).mean())
+
+
+class FrameChangeGate:
+    """
+    Decides whether a frame differs enough from the last accepted frame to
+    be worth processing. Comparing against the last *accepted* thumbnail
+    (not the previous frame) means slow drift still triggers eventually.
+
+    Gray frames and JPEGs are compared as thumbnails (threshold in gray
+    levels); binary masks pixel by pixel (pixel_threshold in pixels).
+    """
+
+    def __init__(self, threshold=CHANGE_THRESHOLD, max_skipped=MAX_SKIPPED,
+                 pixel_threshold=MASK_CHANGE_PIXELS):
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.max_skipped = max_skipped
+        self.reference = None
+        self.seen = 0
+        self.skipped = 0
+        self._run = 0  # Consecutive skips
+        self.last_diff = 0.0
+
+    def changed(self, thumb):
+        """Return True (and take thumb as the new reference) if the frame changed."""
+        return self._decide(thumb, thumbnail_difference, self.threshold)
+
+    def _decide(self, signature, difference, threshold):
+        self.seen += 1
+        ref = self.reference
+        if ref is None or ref.shape != signature.shape or ref.dtype != signature.dtype:
+            self.last_diff = float("inf")
+        else:
+            self.last_diff = difference(signature, ref)
+
+        forced = self.max_skipped and self._run >= self.max_skipped
+        if self.last_diff > threshold or forced:
+            self.reference = signature
+            self._run = 0
+            return True
+
+        self.skipped += 1
+        self._run += 1
+        return False
+
+    def check_array(self, gray):
+        return self.changed(thumbnail_from_array(gray))
+
+    def check_jpeg(self, data):
+        return self.changed(thumbnail_from_jpeg(data))
+
+    def check_mask(self, mask):
+        """Binary 0/255 frame (q1): last_diff is the number of changed pixels."""
+        return self._decide(pack_mask(mask), mask_difference, self.pixel_threshold)
+
+    def reset(self):
+        self.reference = None
+        self._run = 0
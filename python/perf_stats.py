@@ -0,0 +1,51 @@
+import sys
+
+# Shared measurement helpers for the benchmark/soak scripts
+# (esp32_cam_link/soak_test.py, question2_new/live_detect.py and
+# question2_new/resolution_sweep.py), so every report computes memory and
+# latency percentiles the same way.
+
+
+def rss_bytes(peak=False):
+    """
+    Current (or peak) resident set size of this process in bytes.
+    Where /proc is missing only the peak is available, so it is returned
+    for both.
+    """
+    key = "VmHWM:" if peak else "VmRSS:"
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(key):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS (VmHWM) to the current RSS, so rss_bytes(peak=True)
+    measures from now on. Linux only (/proc/self/clear_refs); returns False
+    where the peak cannot be reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def percentile(values, q):
+    """
+    q-th percentile (0..100) of values, nearest rank on the sorted values
+    (numpy's method="nearest"); 0.0 for no values.
+    """
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[int(round(q / 100 * (len(values) - 1)))]
@@ -1,7 +1,10 @@
 from PIL import Image
-import matplotlib.pyplot as plt
+import argparse
+import struct
 from pathlib import Path
 
+from result_cache import ResultCache
+
 
 def rgb_to_grayscale(image):
     """
@@ -23,11 +26,24 @@ def rgb_to_grayscale(image):
     return gray
 
 
-def extract_bright_pixels_histogram(gray, max_pixels=1000):
+def threshold_from_histogram(hist, max_pixels=1000):
     """
-    ESP32-friendly adaptive thresholding using histogram accumulation.
-    Ensures output contains at most 'max_pixels' bright pixels.
-    All other pixels are set to 0.
+    Lowest intensity whose cumulative count, from 255 down, reaches
+    'max_pixels' (255 if the whole histogram stays below it).
+    """
+
+    cumulative = 0
+    for intensity in range(255, -1, -1):
+        cumulative += hist[intensity]
+        if cumulative >= max_pixels:
+            return intensity
+    return 255
+
+
+def histogram_threshold(gray, max_pixels=1000):
+    """
+    Find the lowest intensity that keeps at most about 'max_pixels'
+    pixels, accumulating the histogram from brightest to darkest.
     """
 
     height = len(gray)
@@ -40,13 +56,21 @@ def extract_bright_pixels_histogram(gray, max_pixels=1000):
             hist[gray[y][x]] += 1
 
     # 2. Find threshold from brightest to darkest
-    cumulative = 0
-    threshold = 255
-    for intensity in range(255, -1, -1):
-        cumulative += hist[intensity]
-        if cumulative >= max_pixels:
-            threshold = intensity
-            break
+    return threshold_from_histogram(hist, max_pixels)
+
+
+def extract_bright_pixels_histogram(gray, max_pixels=1000):
+    """
+    ESP32-friendly adaptive thresholding using histogram accumulation.
+    Ensures output contains at most 'max_pixels' bright pixels.
+    All other pixels are set to 0.
+    """
+
+    height = len(gray)
+    width = len(gray[0])
+
+    # 1-2. Histogram and threshold
+    threshold = histogram_threshold(gray, max_pixels)
 
     # 3. Create binary output image
     output = [[0 for _ in range(width)] for _ in range(height)]
@@ -63,12 +87,320 @@ def extract_bright_pixels_histogram(gray, max_pixels=1000):
     return output, threshold
 
 
+def extract_bright_points(gray, max_pixels=1000):
+    """
+    Sparse variant of extract_bright_pixels_histogram.
+    Returns the selected pixels as a raster-ordered (x, y) list instead
+    of a full binary frame, using the same threshold and selection rule.
+    """
+
+    height = len(gray)
+    width = len(gray[0])
+
+    threshold = histogram_threshold(gray, max_pixels)
+
+    points = []
+    for y in range(height):
+        row = gray[y]
+        for x in range(width):
+            if row[x] >= threshold:
+                points.append((x, y))
+                if len(points) >= max_pixels:
+                    return points, threshold
+
+    return points, threshold
+
+
+def fused_threshold(image, target_size=(96, 96), max_pixels=1000):
+    """
+    Fused resize + grayscale + threshold in a single pass over the output.
+
+    For each output pixel the nearest source pixel is gathered (integer
+    inverse mapping, as in q3), converted to luminance and counted in the
+    histogram. The gray values live in one bytearray, which is then
+    thresholded in place, so no other frame-sized buffer is allocated.
+
+    Returns (mask, threshold): mask is a row-major bytearray of 0/255,
+    the same layout as the raw frames sent over the q1 link.
+    """
+
+    input_w, input_h = image.size
+    output_w, output_h = target_size
+    pixels = image.load()
+
+    x_map = [(x * input_w) // output_w for x in range(output_w)]
+
+    # 1. Gather, luminance and histogram in one pass
+    buf = bytearray(output_w * output_h)
+    hist = [0] * 256
+    i = 0
+    for y in range(output_h):
+        src_y = (y * input_h) // output_h
+        for src_x in x_map:
+            r, g, b = pixels[src_x, src_y]
+            v = (30 * r + 59 * g + 11 * b) // 100
+            buf[i] = v
+            hist[v] += 1
+            i += 1
+
+    # 2. Find threshold from brightest to darkest
+    threshold = threshold_from_histogram(hist, max_pixels)
+
+    # 3. Threshold the gray buffer in place
+    selected = 0
+    for i in range(len(buf)):
+        if buf[i] >= threshold and selected < max_pixels:
+            buf[i] = 255
+            selected += 1
+        else:
+            buf[i] = 0
+
+    return buf, threshold
+
+
+def compare_fused_threshold(image, target_size=(96, 96), max_pixels=1000, repeats=5):
+    """
+    PC-only comparison of fused_threshold against the chained
+    q3.resize_nearest_neighbor -> rgb_to_grayscale ->
+    extract_bright_pixels_histogram path, which uses the same integer
+    inverse mapping. Reports best wall time (ms), peak traced allocations
+    (KB) and whether both paths produced the same mask.
+
+    q3 scales both axes by one factor, so target_size must keep the
+    image's aspect ratio for the mappings to be identical.
+    """
+
+    import time
+    import tracemalloc
+    from q3 import resize_nearest_neighbor
+
+    input_w, input_h = image.size
+    output_w, output_h = target_size
+    if input_w * output_h != input_h * output_w:
+        raise ValueError("target_size must keep the aspect ratio of the image")
+
+    def chained():
+        small = resize_nearest_neighbor(image, output_w, input_w, output_size=target_size)
+        gray = rgb_to_grayscale(small)
+        return extract_bright_pixels_histogram(gray, max_pixels)
+
+    def fused():
+        return fused_threshold(image, target_size, max_pixels)
+
+    results = {}
+    for name, fn in (("chained", chained), ("fused", fused)):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = {"ms": best * 1000, "peak_kb": peak / 1024}
+
+    (binary, t1), (mask, t2) = chained(), fused()
+    flat = bytes(v for row in binary for v in row)
+    results["match"] = t1 == t2 and flat == bytes(mask)
+    return results
+
+
+def _find_root(parent, i):
+    # Union-find lookup with path halving
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def connected_components(points, connectivity=8):
+    """
+    Label connected regions of the selected pixels.
+
+    Works directly on the sparse (x, y) list (at most max_pixels entries),
+    never on the full frame: pixels are grouped into horizontal runs and
+    runs that touch a run on the previous row are merged with union-find.
+    Only integer arithmetic is used until the final centroid division.
+
+    Returns a list of component dicts sorted by area (largest first):
+        area, centroid (cx, cy), bbox (x_min, y_min, x_max, y_max)
+    """
+
+    if connectivity not in (4, 8):
+        raise ValueError("connectivity must be 4 or 8")
+    reach = 1 if connectivity == 8 else 0
+
+    # 1. Run-length encode the points row by row: (y, x_start, x_end)
+    runs = []
+    for x, y in sorted(points, key=lambda p: (p[1], p[0])):
+        if runs and runs[-1][0] == y and runs[-1][2] == x - 1:
+            runs[-1][2] = x
+        elif runs and runs[-1][0] == y and runs[-1][2] == x:
+            continue  # Duplicate point
+        else:
+            runs.append([y, x, x])
+
+    if not runs:
+        return []
+
+    # 2. Merge overlapping runs of consecutive rows (two-pointer sweep)
+    parent = list(range(len(runs)))
+    prev_start = prev_end = 0  # Run index range of the previous row
+    row_start = 0
+    for i in range(len(runs) + 1):
+        if i < len(runs) and runs[i][0] == runs[row_start][0]:
+            continue
+
+        # runs[row_start:i] is one complete row
+        row_y = runs[row_start][0]
+        j = prev_start
+        if prev_end > prev_start and runs[prev_start][0] != row_y - 1:
+            j = prev_end  # Previous row is not adjacent
+        for k in range(row_start, i):
+            _, x0, x1 = runs[k]
+            # Skip previous-row runs that end before this one can touch
+            while j < prev_end and runs[j][2] + reach < x0:
+                j += 1
+            m = j
+            while m < prev_end and runs[m][1] - reach <= x1:
+                root_a = _find_root(parent, k)
+                root_b = _find_root(parent, m)
+                if root_a != root_b:
+                    parent[root_a] = root_b
+                m += 1
+
+        prev_start, prev_end = row_start, i
+        row_start = i
+
+    # 3. Accumulate per-component statistics from the runs
+    stats = {}
+    for i, (y, x0, x1) in enumerate(runs):
+        root = _find_root(parent, i)
+        n = x1 - x0 + 1
+        s = stats.get(root)
+        if s is None:
+            s = stats[root] = [0, 0, 0, x0, y, x1, y]
+        s[0] += n
+        s[1] += (x0 + x1) * n // 2  # Sum of x over the run
+        s[2] += y * n
+        s[3] = min(s[3], x0)
+        s[5] = max(s[5], x1)
+        s[6] = y  # Runs are visited in row order
+
+    components = []
+    for area, sum_x, sum_y, x_min, y_min, x_max, y_max in stats.values():
+        components.append({
+            "area": area,
+            "centroid": (sum_x / area, sum_y / area),
+            "bbox": (x_min, y_min, x_max, y_max),
+        })
+
+    components.sort(key=lambda c: c["area"], reverse=True)
+    return components
+
+
+def encode_binary_frame(binary, fmt="rle"):
+    """
+    Reference encoder for the compact q1 link formats (see
+    esp32_cam_q1/receive.py). Integer-only, so it maps directly to C.
+
+    Payload = tag byte + width <H + height <H + body:
+        'B' bitmap : 1 bit per pixel, row-major, MSB first
+        'R' rle    : <H count + <H run lengths, alternating 0/255 runs,
+                     starting with a (possibly empty) run of zeros
+        'S' sparse : <H count + <H flat indices (y * width + x)
+    """
+
+    height = len(binary)
+    width = len(binary[0])
+    header = struct.pack("<HH", width, height)
+
+    if fmt == "bitmap":
+        body = bytearray((width * height + 7) // 8)
+        i = 0
+        for y in range(height):
+            for x in range(width):
+                if binary[y][x]:
+                    body[i >> 3] |= 0x80 >> (i & 7)
+                i += 1
+        return b"B" + header + bytes(body)
+
+    if fmt == "rle":
+        runs = []
+        current = 0
+        length = 0
+        for y in range(height):
+            for x in range(width):
+                value = 255 if binary[y][x] else 0
+                if value != current or length == 0xFFFF:
+                    runs.append(length)
+                    length = 0
+                    if value != current:
+                        current = value
+                    else:
+                        runs.append(0)  # Empty run keeps the 0/255 alternation
+                length += 1
+        runs.append(length)
+        return b"R" + header + struct.pack(f"<H{len(runs)}H", len(runs), *runs)
+
+    if fmt == "sparse":
+        indices = []
+        for y in range(height):
+            for x in range(width):
+                if binary[y][x]:
+                    indices.append(y * width + x)
+        return b"S" + header + struct.pack(f"<H{len(indices)}H", len(indices), *indices)
+
+    raise ValueError(f"Unknown frame format: {fmt}")
+
+
+def decode_binary_frame(payload, width=96, height=96):
+    """
+    Reference decoder for the q1 link formats.
+    Raw frames (width*height bytes of 0/255) are accepted unchanged.
+    """
+
+    if len(payload) == width * height and payload[0] in (0, 255):
+        return [list(payload[y * width:(y + 1) * width]) for y in range(height)]
+
+    tag = payload[0:1]
+    width, height = struct.unpack_from("<HH", payload, 1)
+    flat = [0] * (width * height)
+
+    if tag == b"B":
+        for i in range(width * height):
+            if payload[5 + (i >> 3)] & (0x80 >> (i & 7)):
+                flat[i] = 255
+    elif tag == b"R":
+        count = struct.unpack_from("<H", payload, 5)[0]
+        runs = struct.unpack_from(f"<{count}H", payload, 7)
+        i = 0
+        for k, length in enumerate(runs):
+            if k & 1:
+                flat[i:i + length] = [255] * length
+            i += length
+    elif tag == b"S":
+        count = struct.unpack_from("<H", payload, 5)[0]
+        for index in struct.unpack_from(f"<{count}H", payload, 7):
+            flat[index] = 255
+    else:
+        raise ValueError(f"Unknown frame format tag: {tag!r}")
+
+    return [flat[y * width:(y + 1) * width] for y in range(height)]
+
+
 def visualize(gray, binary):
     """
     Visualization for PC validation only.
     Not part of embedded logic.
     """
 
+    # Imported here so compute-only runs never pay for matplotlib
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(10, 4))
 
     plt.subplot(1, 2, 1)
@@ -85,7 +417,15 @@ def visualize(gray, binary):
     plt.show()
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Question 1: histogram-based thresholding")
+    parser.add_argument("--headless", action="store_true",
+                        help="compute only; skip matplotlib and the figure")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recompute instead of using the on-disk result cache")
+    args = parser.parse_args(argv)
+    cache = ResultCache(enabled=not args.no_cache)
+
     # Load image (RGB) relative to this script's folder
     base_dir = Path(__file__).resolve().parent
     img_path = base_dir / "question1_images" / "reference_taken_from_phone.jpg"
@@ -97,17 +437,28 @@ def main():
     image = image.resize(target_size, Image.BILINEAR)
 
     # Convert to grayscale (ESP32-style)
-    gray = rgb_to_grayscale(image)
+    gray = cache.call(rgb_to_grayscale, image)
 
     # Apply histogram-based thresholding
-    binary, threshold = extract_bright_pixels_histogram(
-        gray, max_pixels=1000
+    binary, threshold = cache.call(
+        extract_bright_pixels_histogram, gray, max_pixels=1000
     )
 
     print("Selected threshold intensity:", threshold)
 
+    # Object centroids and bounding boxes from the sparse selection
+    points, _ = cache.call(extract_bright_points, gray, max_pixels=1000)
+    components = connected_components(points)
+    print(f"Connected components: {len(components)}")
+    for c in components[:5]:
+        cx, cy = c["centroid"]
+        print(f"  area={c['area']:4d}  centroid=({cx:.1f}, {cy:.1f})  bbox={c['bbox']}")
+    if cache.enabled:
+        print(cache.summary())
+
     # Visualization (PC only)
-    visualize(gray, binary)
+    if not args.headless:
+        visualize(gray, binary)
 
 
 if __name__ == "__main__":
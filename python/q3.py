@@ -1,7 +1,14 @@
 from PIL import Image
-import matplotlib.pyplot as plt
+import argparse
+import math
+import operator
+import struct
+import zlib
+import numpy as np
 from pathlib import Path
 
+from result_cache import ResultCache
+
 # ===== Configuration =====
 # Input image settings
 INPUT_IMAGE_PATH = "question1_images/reference_taken_from_phone.jpg"
@@ -19,15 +26,23 @@ OUTPUT_IMAGE_PATH = "question1_images/q3_comparison.png"
 FIGURE_SIZE = (12, 4)  # Figure size in inches (width, height)
 FIGURE_DPI = 150  # Resolution for saved figure
 
+# Streaming resize settings
+BAND_ROWS = 32  # Output rows produced per band
+
+# Fixed-point resampling settings
+WEIGHT_BITS = 8  # Kernel weights are Q8: each tap set sums to 256
+PRE_RESIZE_KERNEL = "area"  # Kernel for the TARGET_SIZE pre-resize in main()
+
 # ===== End Configuration =====
 
 
-def resize_nearest_neighbor(image, scale_num, scale_den):
+def resize_nearest_neighbor(image, scale_num, scale_den, output_size=None):
     """
     ESP32-friendly nearest neighbor resize using integer arithmetic.
 
     scale = scale_num / scale_den
     Works with RGB images (3 channels).
+    output_size=(w, h) overrides the computed output dimensions.
     """
 
     input_h = image.height
@@ -35,8 +50,11 @@ def resize_nearest_neighbor(image, scale_num, scale_den):
     pixels = image.load()
 
     # Compute output dimensions using integer math
-    output_h = (input_h * scale_num) // scale_den
-    output_w = (input_w * scale_num) // scale_den
+    if output_size:
+        output_w, output_h = output_size
+    else:
+        output_h = (input_h * scale_num) // scale_den
+        output_w = (input_w * scale_num) // scale_den
 
     # Create output image
     output = Image.new('RGB', (output_w, output_h))
@@ -60,12 +78,384 @@ def resize_nearest_neighbor(image, scale_num, scale_den):
     return output
 
 
+# ===== Band-streaming resize (bounded memory) =====
+
+def image_row_reader(image):
+    """Row reader over a PIL RGB image: read(y0, y1) -> list of row bytes."""
+    width = image.width
+
+    def read(y0, y1):
+        band = image.crop((0, y0, width, y1)).tobytes()
+        stride = width * 3
+        return [band[i * stride:(i + 1) * stride] for i in range(y1 - y0)]
+
+    return read
+
+
+def raw_row_reader(f, width, offset=0):
+    """
+    Row reader over a raw interleaved RGB file object (e.g. a frame dump).
+    Only the requested rows are ever read from disk.
+    """
+    stride = width * 3
+
+    def read(y0, y1):
+        f.seek(offset + y0 * stride)
+        band = f.read((y1 - y0) * stride)
+        return [band[i * stride:(i + 1) * stride] for i in range(y1 - y0)]
+
+    return read
+
+
+class RawBandWriter:
+    """Appends output bands to a raw interleaved RGB file."""
+
+    def __init__(self, path, width, height):
+        self.f = open(path, "wb")
+
+    def write(self, y0, rows):
+        self.f.write(b"".join(rows))
+
+    def close(self):
+        self.f.close()
+
+
+class MemmapBandWriter:
+    """Writes output bands into a memory-mapped (height, width, 3) .npy array."""
+
+    def __init__(self, path, width, height):
+        self.array = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.uint8, shape=(height, width, 3)
+        )
+        self.width = width
+
+    def write(self, y0, rows):
+        band = np.frombuffer(b"".join(rows), dtype=np.uint8)
+        self.array[y0:y0 + len(rows)] = band.reshape(len(rows), self.width, 3)
+        self.array.flush()
+
+    def close(self):
+        self.array.flush()
+        del self.array
+
+
+class PngBandWriter:
+    """
+    Incremental PNG encoder: each band is deflated and emitted as an IDAT
+    chunk, so the full output image never exists in memory.
+    """
+
+    def __init__(self, path, width, height, level=6):
+        self.f = open(path, "wb")
+        self.compressor = zlib.compressobj(level)
+        self.f.write(b"\x89PNG\r\n\x1a\n")
+        # 8-bit RGB, no interlace
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.f.write(struct.pack(">I", len(data)))
+        self.f.write(kind + data)
+        self.f.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    def write(self, y0, rows):
+        # Filter type 0 (None) in front of every scanline
+        data = self.compressor.compress(b"".join(b"\x00" + row for row in rows))
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self):
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+        self.f.close()
+
+
+def resize_nearest_neighbor_streaming(read_rows, input_size, scale_num, scale_den,
+                                      writer, band_rows=BAND_ROWS):
+    """
+    Band-by-band version of resize_nearest_neighbor for images too large
+    to hold in memory.
+
+    read_rows(y0, y1) returns input rows y0..y1-1 as RGB bytes and
+    writer.write(y0, rows) receives each finished output band. Only the
+    input strip feeding the current band and the band itself are held,
+    so peak memory is a few bands whatever the image size. Uses the same
+    integer inverse mapping as resize_nearest_neighbor.
+    """
+
+    input_w, input_h = input_size
+    output_h = (input_h * scale_num) // scale_den
+    output_w = (input_w * scale_num) // scale_den
+
+    # Byte gather table for one output row: 3 channel bytes per pixel
+    byte_index = []
+    for x in range(output_w):
+        src_x = min((x * scale_den) // scale_num, input_w - 1)
+        byte_index.extend((3 * src_x, 3 * src_x + 1, 3 * src_x + 2))
+    gather = operator.itemgetter(*byte_index) if byte_index else (lambda row: ())
+
+    for y0 in range(0, output_h, band_rows):
+        y1 = min(y0 + band_rows, output_h)
+
+        # Contiguous input strip covering this band
+        src_rows = [min((y * scale_den) // scale_num, input_h - 1) for y in range(y0, y1)]
+        strip_y0 = src_rows[0]
+        strip = read_rows(strip_y0, src_rows[-1] + 1)
+
+        rows = []
+        last_src = -1
+        for src_y in src_rows:
+            if src_y != last_src:  # Upsampling repeats source rows
+                row = bytes(gather(strip[src_y - strip_y0]))
+                last_src = src_y
+            rows.append(row)
+
+        writer.write(y0, rows)
+
+    writer.close()
+    return output_w, output_h
+
+
+# ===== Fixed-point resampling kernels (integer-only, LUT driven) =====
+# Each kernel is described per axis by two lookup tables of shape
+# (output_len, taps): source indices and Q8 weights summing to 256.
+# On the ESP32 the same tables are built once per scale and the inner
+# loop is just multiply-accumulate and a shift; on the PC the taps are
+# applied to whole rows/columns with numpy.
+
+def nearest_lut(input_len, output_len, scale_num, scale_den):
+    """Single-tap table reproducing resize_nearest_neighbor's mapping."""
+    src = (np.arange(output_len, dtype=np.int64) * scale_den) // scale_num
+    idx = np.minimum(src, input_len - 1)[:, None]
+    wt = np.full((output_len, 1), 1 << WEIGHT_BITS, dtype=np.int32)
+    return idx, wt
+
+
+def bilinear_lut(input_len, output_len, scale_num, scale_den):
+    """
+    Two-tap bilinear table with pixel-centre alignment:
+        src = (x + 0.5) * den / num - 0.5, in Q8 fixed point
+    """
+    one = 1 << WEIGHT_BITS
+    x = np.arange(output_len, dtype=np.int64)
+    # ((2x + 1) * den - num) / (2 * num), scaled by 2^WEIGHT_BITS
+    src_fp = (((2 * x + 1) * scale_den - scale_num) << WEIGHT_BITS) // (2 * scale_num)
+    src_fp = np.clip(src_fp, 0, (input_len - 1) << WEIGHT_BITS)
+
+    x0 = src_fp >> WEIGHT_BITS
+    x1 = np.minimum(x0 + 1, input_len - 1)
+    frac = (src_fp & (one - 1)).astype(np.int32)
+
+    idx = np.stack([x0, x1], axis=1)
+    wt = np.stack([one - frac, frac], axis=1)
+    return idx, wt
+
+
+def area_lut(input_len, output_len, scale_num, scale_den):
+    """
+    Area-average (box) table: each output pixel averages the source pixels
+    it covers, weighted by overlap. Coordinates are kept in units of
+    1/scale_num source pixels so every overlap is an exact integer.
+    """
+    one = 1 << WEIGHT_BITS
+    taps = -(-scale_den // scale_num) + 1  # ceil(den / num) + 1
+
+    x = np.arange(output_len, dtype=np.int64)
+    lo = x * scale_den                      # Output span [lo, hi)
+    hi = lo + scale_den
+    first = lo // scale_num                 # First source pixel touched
+
+    idx = first[:, None] + np.arange(taps)[None, :]
+    src_lo = idx * scale_num
+    overlap = np.minimum(hi[:, None], src_lo + scale_num) - np.maximum(lo[:, None], src_lo)
+    overlap = np.maximum(overlap, 0)
+
+    # Past the right edge: fold the weight onto the last source pixel
+    idx = np.minimum(idx, input_len - 1)
+
+    # Quantize to Q8 and push the rounding remainder onto the largest tap
+    wt = (overlap * one + scale_den // 2) // scale_den
+    largest = np.argmax(overlap, axis=1)
+    wt[x, largest] += one - wt.sum(axis=1)
+    return idx, wt.astype(np.int32)
+
+
+RESAMPLE_LUTS = {
+    "nearest": nearest_lut,
+    "bilinear": bilinear_lut,
+    "area": area_lut,
+}
+
+
+def _apply_taps(pixels, idx, wt, axis):
+    # Weighted sum of gathered rows (axis 0) or columns (axis 1)
+    acc = None
+    for k in range(idx.shape[1]):
+        w = wt[:, k][:, None, None] if axis == 0 else wt[:, k][None, :, None]
+        term = np.take(pixels, idx[:, k], axis=axis) * w
+        acc = term if acc is None else acc + term
+    return acc
+
+
+def resize_fixed_point(image, scale_num, scale_den, kernel="bilinear", output_size=None):
+    """
+    Integer-only separable resize of an RGB image.
+
+    kernel is "nearest", "bilinear" or "area". The vertical pass leaves
+    Q8 intermediates and the horizontal pass brings them to Q16, which
+    is rounded back to 8 bits once; all arithmetic is int32.
+    output_size=(w, h) resizes to an explicit size instead of a scale
+    (the per-axis scale is then output/input).
+    """
+
+    build_lut = RESAMPLE_LUTS[kernel]
+    pixels = np.asarray(image.convert("RGB"), dtype=np.int32)
+    input_h, input_w = pixels.shape[:2]
+
+    if output_size:
+        output_w, output_h = output_size
+        scale_x, scale_y = (output_w, input_w), (output_h, input_h)
+    else:
+        output_w = (input_w * scale_num) // scale_den
+        output_h = (input_h * scale_num) // scale_den
+        scale_x = scale_y = (scale_num, scale_den)
+
+    idx_y, wt_y = build_lut(input_h, output_h, *scale_y)
+    idx_x, wt_x = build_lut(input_w, output_w, *scale_x)
+
+    rows = _apply_taps(pixels, idx_y, wt_y, axis=0)   # Q8
+    out = _apply_taps(rows, idx_x, wt_x, axis=1)      # Q16
+
+    shift = 2 * WEIGHT_BITS
+    out = (out + (1 << (shift - 1))) >> shift
+    return Image.fromarray(out.astype(np.uint8), mode="RGB")
+
+
+def benchmark_resize_kernels(image, scale_num, scale_den, repeats=5):
+    """
+    PC-only timing and quality of each fixed-point kernel against the
+    current pure-Python resize_nearest_neighbor. Quality is PSNR (dB)
+    relative to Pillow's float LANCZOS resize to the same size.
+    """
+
+    import time
+
+    def best_time(fn):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - start)
+        return result, best * 1000
+
+    def psnr(a, b):
+        diff = np.asarray(a, dtype=np.int32) - np.asarray(b, dtype=np.int32)
+        mse = float(np.mean(diff * diff))
+        return float("inf") if mse == 0 else 10 * math.log10(255 * 255 / mse)
+
+    baseline, baseline_ms = best_time(
+        lambda: resize_nearest_neighbor(image, scale_num, scale_den))
+    reference = image.resize(baseline.size, Image.LANCZOS)
+
+    results = [{
+        "kernel": "nearest (pure Python)",
+        "ms": baseline_ms,
+        "speedup": 1.0,
+        "psnr_db": psnr(baseline, reference),
+    }]
+    for kernel in RESAMPLE_LUTS:
+        out, ms = best_time(
+            lambda: resize_fixed_point(image, scale_num, scale_den, kernel))
+        results.append({
+            "kernel": kernel,
+            "ms": ms,
+            "speedup": baseline_ms / ms,
+            "psnr_db": psnr(out, reference),
+        })
+    return results
+
+
+def load_jpeg_scaled(source, scale_num, scale_den):
+    """
+    Decode a JPEG directly at scale_num / scale_den of its size.
+
+    The JPEG decoder can downscale by 1/2, 1/4 or 1/8 in the DCT domain
+    (Image.draft), which skips most of the decode work. The largest such
+    factor that does not go below the target is used, and the remaining
+    scale is finished with resize_nearest_neighbor. Non-JPEG input, or a
+    target above 1/2 scale, falls back to a full decode.
+    """
+
+    image = Image.open(source)
+    input_w, input_h = image.size
+    output_w = (input_w * scale_num) // scale_den
+    output_h = (input_h * scale_num) // scale_den
+
+    dct_scale = 1
+    if output_w > 0 and output_h > 0:
+        drafted = image.draft("RGB", (output_w, output_h))
+        if drafted is not None:
+            dct_scale = round(input_w / drafted[1][2])
+
+    image = image.convert("RGB")
+    if image.size == (output_w, output_h):
+        return image
+
+    # Exact power-of-two scale: the draft is the result, up to rounding
+    if scale_num * dct_scale == scale_den:
+        return image.crop((0, 0, output_w, output_h))
+
+    # Source index in the reduced image: (y * den / num) / dct_scale
+    return resize_nearest_neighbor(
+        image, scale_num * dct_scale, scale_den, output_size=(output_w, output_h)
+    )
+
+
+def compare_jpeg_decode(path, scale_num, scale_den, repeats=5):
+    """
+    PC-only comparison of load_jpeg_scaled against a full decode followed
+    by resize_nearest_neighbor. Returns timings (ms) and PSNR (dB) of the
+    reduced decode relative to the full-decode result.
+    """
+
+    import time
+
+    def best_time(fn):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - start)
+        return result, best * 1000
+
+    full, full_ms = best_time(lambda: resize_nearest_neighbor(
+        Image.open(path).convert("RGB"), scale_num, scale_den))
+    fast, fast_ms = best_time(lambda: load_jpeg_scaled(path, scale_num, scale_den))
+
+    # Mean squared error over all channels, integer accumulation
+    sq_sum = 0
+    for a, b in zip(full.tobytes(), fast.tobytes()):
+        sq_sum += (a - b) * (a - b)
+    mse = sq_sum / (full.width * full.height * 3)
+    psnr = float("inf") if mse == 0 else 10 * math.log10(255 * 255 / mse)
+
+    return {
+        "size": full.size,
+        "full_decode_ms": full_ms,
+        "draft_decode_ms": fast_ms,
+        "speedup": full_ms / fast_ms,
+        "psnr_db": psnr,
+    }
+
+
 def visualize(original, upsampled, downsampled, save_path=None, figsize=(12, 4), dpi=150):
     """
     Visualization for PC validation only.
     Not part of embedded logic.
     """
 
+    # Imported here so compute-only runs never pay for matplotlib
+    import matplotlib.pyplot as plt
+
     # Get dimensions for each image
     orig_w, orig_h = original.size
     up_w, up_h = upsampled.size
@@ -103,7 +493,15 @@ def visualize(original, upsampled, downsampled, save_path=None, figsize=(12, 4),
         plt.show()
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Question 3: nearest neighbor resizing")
+    parser.add_argument("--headless", action="store_true",
+                        help="compute only; skip matplotlib and the comparison figure")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recompute instead of using the on-disk result cache")
+    args = parser.parse_args(argv)
+    cache = ResultCache(enabled=not args.no_cache)
+
     # Load image relative to this script's folder
     base_dir = Path(__file__).resolve().parent
     img_path = base_dir / INPUT_IMAGE_PATH
@@ -111,22 +509,30 @@ def main():
     print(f"Loading image from: {img_path}")
     image = Image.open(img_path).convert("RGB")
     
-    # Resize to target size (similar to ESP32 resolution)
-    image = image.resize(TARGET_SIZE, Image.BILINEAR)
-    print(f"Resized to: {TARGET_SIZE}")
+    # Resize to target size (similar to ESP32 resolution), integer-only
+    image = cache.call(resize_fixed_point, image, 1, 1,
+                       kernel=PRE_RESIZE_KERNEL, output_size=TARGET_SIZE)
+    print(f"Resized to: {TARGET_SIZE} ({PRE_RESIZE_KERNEL})")
     
     # Upsample
     upscale = UPSAMPLE_SCALE_NUM / UPSAMPLE_SCALE_DEN
     print(f"Upsampling ({upscale}x)...")
-    upsampled = resize_nearest_neighbor(image, scale_num=UPSAMPLE_SCALE_NUM, scale_den=UPSAMPLE_SCALE_DEN)
+    upsampled = cache.call(resize_nearest_neighbor, image,
+                           scale_num=UPSAMPLE_SCALE_NUM, scale_den=UPSAMPLE_SCALE_DEN)
     print(f"Upsampled size: {upsampled.size[0]}x{upsampled.size[1]}")
     
     # Downsample
     downscale = DOWNSAMPLE_SCALE_NUM / DOWNSAMPLE_SCALE_DEN
     print(f"Downsampling ({downscale})...")
-    downsampled = resize_nearest_neighbor(image, scale_num=DOWNSAMPLE_SCALE_NUM, scale_den=DOWNSAMPLE_SCALE_DEN)
+    downsampled = cache.call(resize_nearest_neighbor, image,
+                             scale_num=DOWNSAMPLE_SCALE_NUM, scale_den=DOWNSAMPLE_SCALE_DEN)
     print(f"Downsampled size: {downsampled.size[0]}x{downsampled.size[1]}")
+    if cache.enabled:
+        print(cache.summary())
     
+    if args.headless:
+        return
+
     # Save comparison image
     output_path = base_dir / OUTPUT_IMAGE_PATH
     visualize(image, upsampled, downsampled, save_path=str(output_path), figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
@@ -0,0 +1,347 @@
+"""
+Dataset Shards - pack images/labels into a few large files with mmap access
+
+USAGE:
+    python dataset_shards.py            # pack all splits, then benchmark
+    python dataset_shards.py --pack
+    python dataset_shards.py --bench --epochs 5
+
+    from dataset_shards import ShardDataset
+    ds = ShardDataset("shards", "train")
+    image, labels = ds[3]          # BGR array, (k, 5) float32 [cls cx cy w h]
+
+    Per split, SHARD_DIR holds:
+      <split>-00000.shard  encoded images (original PNG/JPG bytes) back to back
+      <split>.index.npy    one record per image: shard, offset, length,
+                           label_start, label_count, height, width
+      <split>.labels.npy   all YOLO labels of the split in one (M, 5) array
+      <split>.json         image names, shard files, format version and
+                           content hashes (SHA-256 of every shard, the
+                           index and the labels)
+    Shards roll over at MAX_SHARD_BYTES. Images are not re-encoded.
+
+    With USE_SHARDS on, train.py/test.py read through the mmap as well
+    (shard_ultralytics.py plugs ShardDataset into the ultralytics trainer
+    and validator) and infer.py decodes straight from it. unpack_dataset()
+    still writes loose files for tools that need them.
+"""
+
+import io
+import os
+import json
+import hashlib
+import time
+import random
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+IMAGES_DIR = Path("images")
+LABELS_DIR = Path("labels")
+SHARD_DIR = Path("shards")
+SPLITS = ("train", "val", "test")
+MAX_SHARD_BYTES = 256 * 1024 * 1024
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+FORMAT_VERSION = 2
+
+CLASS_NAMES = {0: "0", 1: "4", 2: "7"}
+
+INDEX_DTYPE = np.dtype([
+    ("shard", "<u2"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("label_start", "<u4"),
+    ("label_count", "<u2"),
+    ("height", "<u2"),
+    ("width", "<u2"),
+])
+
+# ============================================================================
+# PACKING
+# ============================================================================
+def read_label_file(path):
+    """YOLO label file -> (k, 5) float32 array (empty if missing)."""
+    if not Path(path).exists():
+        return np.zeros((0, 5), dtype=np.float32)
+    rows = [line.split() for line in Path(path).read_text().splitlines() if line.strip()]
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+
+def image_size(data):
+    """(height, width) from the encoded image header, without decoding."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as im:
+        return im.height, im.width
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def pack_split(split, images_dir=IMAGES_DIR, labels_dir=LABELS_DIR,
+               out_dir=SHARD_DIR, max_shard_bytes=MAX_SHARD_BYTES):
+    """Pack images/<split> + labels/<split> into shards. Returns the image count."""
+    image_dir = Path(images_dir) / split
+    label_dir = Path(labels_dir) / split
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    names = sorted(p.name for p in image_dir.iterdir()
+                   if p.suffix.lower() in IMAGE_EXTS)
+    index = np.zeros(len(names), dtype=INDEX_DTYPE)
+    labels = []
+    label_total = 0
+    shards = []
+    shard_hashes = []
+    shard = None
+    offset = 0
+
+    try:
+        for i, name in enumerate(names):
+            data = (image_dir / name).read_bytes()
+            if shard is None or (offset and offset + len(data) > max_shard_bytes):
+                if shard:
+                    shard.close()
+                shards.append(f"{split}-{len(shards):05d}.shard")
+                shard_hashes.append(hashlib.sha256())
+                shard = open(out_dir / (shards[-1] + ".tmp"), "wb")
+                offset = 0
+            shard.write(data)
+            shard_hashes[-1].update(data)
+
+            lab = read_label_file(label_dir / (Path(name).stem + ".txt"))
+            index[i] = (len(shards) - 1, offset, len(data), label_total, len(lab),
+                        *image_size(data))
+            labels.append(lab)
+            label_total += len(lab)
+            offset += len(data)
+    finally:
+        if shard:
+            shard.close()
+
+    labels = np.concatenate(labels) if labels else np.zeros((0, 5), np.float32)
+
+    # Shards first, manifest last: a reader never sees a manifest without data
+    for name in shards:
+        os.replace(out_dir / (name + ".tmp"), out_dir / name)
+    np.save(out_dir / f"{split}.index.npy", index)
+    np.save(out_dir / f"{split}.labels.npy", labels.astype(np.float32))
+    # Content identity: re-packing changed images or labels changes the
+    # manifest, which is what unpack_dataset() stamps
+    manifest = {
+        "version": FORMAT_VERSION,
+        "names": names,
+        "shards": shards,
+        "shard_sha256": [h.hexdigest() for h in shard_hashes],
+        "index_sha256": file_sha256(out_dir / f"{split}.index.npy"),
+        "labels_sha256": file_sha256(out_dir / f"{split}.labels.npy"),
+    }
+    tmp = out_dir / f"{split}.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, out_dir / f"{split}.json")
+    return len(names)
+
+
+def pack_dataset(out_dir=SHARD_DIR, splits=SPLITS):
+    for split in splits:
+        if not (IMAGES_DIR / split).exists():
+            print(f"  {split}: no images/{split}, skipped")
+            continue
+        n = pack_split(split, out_dir=out_dir)
+        size = sum(p.stat().st_size for p in Path(out_dir).glob(f"{split}-*.shard"))
+        print(f"  {split}: {n} images -> {size / 1e6:.2f} MB of shards")
+
+# ============================================================================
+# LOADING
+# ============================================================================
+class ShardDataset:
+    """Random access to one packed split through read-only memory maps."""
+
+    def __init__(self, shard_dir=SHARD_DIR, split="train"):
+        shard_dir = Path(shard_dir)
+        with open(shard_dir / f"{split}.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported shard format version {manifest['version']}")
+
+        self.shard_dir = shard_dir
+        self.split = split
+        self.names = manifest["names"]
+        self.index = np.load(shard_dir / f"{split}.index.npy", mmap_mode="r")
+        self.all_labels = np.load(shard_dir / f"{split}.labels.npy", mmap_mode="r")
+        self.shards = [
+            np.memmap(shard_dir / name, dtype=np.uint8, mode="r")
+            if (shard_dir / name).stat().st_size else np.zeros(0, np.uint8)
+            for name in manifest["shards"]
+        ]
+
+    def __getstate__(self):
+        # Dataloader workers (spawn) reopen the maps instead of pickling
+        # the shard contents
+        return {"shard_dir": self.shard_dir, "split": self.split}
+
+    def __setstate__(self, state):
+        self.__init__(state["shard_dir"], state["split"])
+
+    def __len__(self):
+        return len(self.names)
+
+    def encoded(self, i):
+        """Encoded image bytes of item i (a zero-copy view into the shard)."""
+        rec = self.index[i]
+        start = int(rec["offset"])
+        return self.shards[int(rec["shard"])][start:start + int(rec["length"])]
+
+    def image(self, i, flags=None):
+        import cv2
+
+        flags = cv2.IMREAD_COLOR if flags is None else flags
+        image = cv2.imdecode(self.encoded(i), flags)
+        if image is None:
+            raise ValueError(f"Could not decode {self.names[i]}")
+        return image
+
+    def labels(self, i):
+        """(k, 5) float32 array: class, center x, center y, width, height."""
+        rec = self.index[i]
+        start = int(rec["label_start"])
+        return np.asarray(self.all_labels[start:start + int(rec["label_count"])])
+
+    def __getitem__(self, i):
+        return self.image(i), self.labels(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def unpack_dataset(shard_dir=SHARD_DIR, out_dir="shard_dataset", splits=SPLITS):
+    """
+    Write shards back out as images/<split> + labels/<split> and a data.yaml
+    for ultralytics (out_dir is created if needed). Splits already unpacked
+    from the same manifest (same content hashes) are kept.
+    Returns the data.yaml path.
+    """
+    shard_dir, out_dir = Path(shard_dir), Path(out_dir)
+    for split in splits:
+        manifest = shard_dir / f"{split}.json"
+        if not manifest.exists():
+            continue
+        stamp = out_dir / f".{split}.unpacked"
+        if stamp.exists() and stamp.read_text() == manifest.read_text():
+            continue
+
+        ds = ShardDataset(shard_dir, split)
+        img_dir = out_dir / "images" / split
+        lab_dir = out_dir / "labels" / split
+        img_dir.mkdir(parents=True, exist_ok=True)
+        lab_dir.mkdir(parents=True, exist_ok=True)
+        for i, name in enumerate(ds.names):
+            (img_dir / name).write_bytes(ds.encoded(i).tobytes())
+            with open(lab_dir / (Path(name).stem + ".txt"), "w") as f:
+                for cls, cx, cy, w, h in ds.labels(i):
+                    f.write(f"{int(cls)} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}\n")
+        stamp.write_text(manifest.read_text())
+
+    yaml_path = out_dir / "data.yaml"
+    with open(yaml_path, "w", encoding="utf-8") as f:
+        f.write(f"path: {out_dir.resolve().as_posix()}\n\n")
+        # All splits listed like data.yaml; ultralytics only checks the ones it uses
+        for split in SPLITS:
+            f.write(f"{split}: images/{split}\n")
+        f.write("\nnames:\n")
+        for cls_id, name in CLASS_NAMES.items():
+            f.write(f"  {cls_id}: {name}\n")
+    return yaml_path
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+def _loose_epoch(paths, decode=True):
+    import cv2
+
+    for img_path, label_path in paths:
+        if decode:
+            image = cv2.imread(str(img_path))
+        else:
+            image = Path(img_path).read_bytes()
+        labels = read_label_file(label_path)
+        assert image is not None and labels is not None
+
+
+def _shard_epoch(ds, order, decode=True):
+    for i in order:
+        image = ds.image(i) if decode else ds.encoded(i).tobytes()
+        labels = ds.labels(i)
+        assert image is not None and labels is not None
+
+
+def benchmark_loading(split="train", epochs=3, shard_dir=SHARD_DIR, seed=0):
+    """
+    Time full random-order passes over the loose files and over the shards:
+    I/O only (image bytes + labels) and with image decoding.
+    Returns mean seconds per epoch.
+    """
+    ds = ShardDataset(shard_dir, split)
+    paths = [(IMAGES_DIR / split / name,
+              LABELS_DIR / split / (Path(name).stem + ".txt")) for name in ds.names]
+    rng = random.Random(seed)
+    totals = {"loose_io": 0.0, "shard_io": 0.0, "loose_s": 0.0, "shard_s": 0.0}
+
+    for _ in range(epochs):
+        order = list(range(len(ds)))
+        rng.shuffle(order)
+        for decode, suffix in ((False, "io"), (True, "s")):
+            start = time.perf_counter()
+            _loose_epoch([paths[i] for i in order], decode)
+            totals[f"loose_{suffix}"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            _shard_epoch(ds, order, decode)
+            totals[f"shard_{suffix}"] += time.perf_counter() - start
+
+    result = {key: value / epochs for key, value in totals.items()}
+    result["images"] = len(ds)
+    return result
+
+# ============================================================================
+# MAIN
+# ============================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack the dataset into shards")
+    parser.add_argument("--pack", action="store_true", help="only pack")
+    parser.add_argument("--bench", action="store_true", help="only benchmark")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--out", default=str(SHARD_DIR))
+    args = parser.parse_args(argv)
+    do_pack = args.pack or not args.bench
+    do_bench = args.bench or not args.pack
+
+    if do_pack:
+        print(f"Packing dataset into {args.out}")
+        pack_dataset(args.out)
+
+    if do_bench:
+        print(f"\nData loading per epoch, ms (mean of {args.epochs}, random order):")
+        print(f"  {'split':<6}{'images':>7}{'I/O loose':>11}{'I/O shard':>11}{'speedup':>9}"
+              f"{'+decode loose':>15}{'+decode shard':>15}{'speedup':>9}")
+        for split in SPLITS:
+            if not (Path(args.out) / f"{split}.json").exists():
+                continue
+            r = benchmark_loading(split, args.epochs, args.out)
+            print(f"  {split:<6}{r['images']:>7}"
+                  f"{r['loose_io'] * 1000:>11.1f}{r['shard_io'] * 1000:>11.1f}"
+                  f"{r['loose_io'] / max(r['shard_io'], 1e-9):>8.1f}x"
+                  f"{r['loose_s'] * 1000:>15.1f}{r['shard_s'] * 1000:>15.1f}"
+                  f"{r['loose_s'] / max(r['shard_s'], 1e-9):>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,14 @@ Compatible with:
 - ultralytics >= 8.3.0
 """
 
-from ultralytics import YOLO
 import os
-import pandas as pd
+import time
 from pathlib import Path
-import cv2
 import glob
 
+import model_registry
+from profiling import StageProfiler, record_speed
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -22,17 +23,35 @@ TEST_DIR = "images/test"
 OUTPUT_DIR = "figures"
 CONF_THRESHOLD = 0.25
 
+# Tiled inference for large scans: images bigger than one tile are cut into
+# overlapping TILE_SIZE crops, run in batches and merged with a cross-tile NMS
+TILED = False
+TILE_SIZE = 320       # Same as IMGSZ in train.py, so digits keep their trained scale
+TILE_OVERLAP = TILE_SIZE // 4  # Digits on full pages are small next to a tile
+TILE_BATCH = 16       # Tiles per forward pass (bounds memory)
+TILE_EDGE_MARGIN = 2  # Boxes this close to an inner tile edge are cut-off digits
+TILE_MERGE_OVERLAP = 0.3  # Intersection / smaller box that joins a cut-off piece
+MAX_DETECTIONS = 300  # Highest-scoring boxes kept per class before merging
+NMS_IOU = 0.5
+
+# Read test images from packed shards (dataset_shards.py) through mmap
+USE_SHARDS = False
+SHARD_DIR = Path("shards")
+SHARD_SPLIT = "test"
+
+# Opt-in profiling: timing_infer.txt is written into the model's experiment folder
+PROFILE = False
+PROFILE_CPROFILE = False      # Also collect a cProfile of every stage
+PROFILE_TRACEMALLOC = False   # Also track peak memory per stage
+
 # ============================================================================
 # HELPERS
 # ============================================================================
 def load_best_model_path():
-    csv_path = RESULTS_DIR / "validation_metrics.csv"
-    if not csv_path.exists():
+    best = model_registry.best_experiment()
+    if not best:
         return None
 
-    df = pd.read_csv(csv_path)
-    best = df.loc[df["mAP50"].idxmax()]
-
     print("Best model from hyperparameter search:")
     print(
         f"  {best['name']} | "
@@ -42,6 +61,172 @@ def load_best_model_path():
 
     return best["model_path"]
 
+# ============================================================================
+# TILED DETECTION
+# ============================================================================
+def tile_origins(length, tile, overlap):
+    """Start offsets of overlapping tiles covering [0, length)."""
+    if length <= tile:
+        return [0]
+    step = tile - overlap
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def top_per_class(scores, classes, max_det=MAX_DETECTIONS):
+    """Indices of the max_det highest scores of every class, best first."""
+    import numpy as np
+
+    order = np.argsort(-scores, kind="stable")
+    rank = np.empty_like(order)
+    for cls_id in np.unique(classes):
+        members = order[classes[order] == cls_id]
+        rank[members] = np.arange(len(members))
+    return order[rank[order] < max_det]
+
+
+def nms(boxes, scores, classes, iou_threshold=NMS_IOU, max_det=MAX_DETECTIONS):
+    """
+    Class-aware NMS. boxes (N, 4) xyxy, scores (N,), classes (N,).
+    Only the max_det best boxes of each class are considered, and
+    torchvision's kernel needs no N x N matrix, so memory stays bounded
+    however many tiles a page has.
+    Returns indices of kept boxes, highest score first.
+    """
+    import numpy as np
+    import torch
+    from torchvision.ops import batched_nms
+
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    candidates = top_per_class(scores, classes, max_det)
+
+    keep = batched_nms(torch.from_numpy(boxes[candidates]).float(),
+                       torch.from_numpy(scores[candidates]).float(),
+                       torch.from_numpy(classes[candidates]),
+                       iou_threshold)
+    return candidates[keep.numpy()]
+
+
+def merge_cut_boxes(boxes, scores, classes, cut, min_overlap=TILE_MERGE_OVERLAP):
+    """
+    Join boxes cut by a tile edge with the same-class boxes they overlap
+    (the rest of the digit, seen by the neighbouring tiles): the pair is
+    replaced by its union with the higher score. boxes must be few (NMS
+    survivors plus capped pieces); returns the merged (boxes, scores, classes).
+    """
+    import numpy as np
+
+    boxes, scores, cut = boxes.copy(), scores.copy(), cut.copy()
+    alive = np.ones(len(boxes), dtype=bool)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    for i in np.argsort(-scores, kind="stable"):
+        if not (alive[i] and cut[i]):
+            continue
+        while True:
+            ix1 = np.maximum(boxes[i, 0], boxes[:, 0])
+            iy1 = np.maximum(boxes[i, 1], boxes[:, 1])
+            ix2 = np.minimum(boxes[i, 2], boxes[:, 2])
+            iy2 = np.minimum(boxes[i, 3], boxes[:, 3])
+            inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+            overlap = inter / (np.minimum(area[i], area) + 1e-9)
+            partners = alive & (classes == classes[i]) & (overlap >= min_overlap)
+            partners[i] = False
+            if not partners.any():
+                break
+            j = np.flatnonzero(partners)[np.argmax(scores[partners])]
+            boxes[i, :2] = np.minimum(boxes[i, :2], boxes[j, :2])
+            boxes[i, 2:] = np.maximum(boxes[i, 2:], boxes[j, 2:])
+            area[i] = (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1])
+            scores[i] = max(scores[i], scores[j])
+            cut[i] = cut[i] and cut[j]
+            alive[j] = False
+            if not cut[i]:
+                break
+    return boxes[alive], scores[alive], classes[alive]
+
+
+def detect_tiled(model, image, conf=CONF_THRESHOLD, tile=TILE_SIZE,
+                 overlap=TILE_OVERLAP, batch=TILE_BATCH, profiler=None):
+    """
+    Sliding-window detection on a BGR image (H, W, 3).
+    Duplicates of whole digits from overlapping tiles are removed by NMS;
+    pieces cut by a tile edge skip the NMS (two halves of a large digit
+    overlap enough to suppress each other) and are joined to the rest of
+    the digit by merge_cut_boxes.
+    Returns (boxes xyxy in image coordinates, scores, classes, n_tiles).
+    """
+    import numpy as np
+
+    h, w = image.shape[:2]
+    origins = [(x, y)
+               for y in tile_origins(h, tile, overlap)
+               for x in tile_origins(w, tile, overlap)]
+
+    all_boxes, all_scores, all_classes, all_cut = [], [], [], []
+    for i in range(0, len(origins), batch):
+        chunk = origins[i:i + batch]
+        tiles = [image[y:y + tile, x:x + tile] for x, y in chunk]
+
+        results = model(tiles, imgsz=tile, conf=conf, verbose=False)
+        if profiler is not None:
+            record_speed(profiler, results[0].speed, len(tiles))
+            profiler.count("tiles", len(tiles))
+
+        for (x, y), crop, result in zip(chunk, tiles, results):
+            if result.boxes is None or len(result.boxes) == 0:
+                continue
+            xyxy = result.boxes.xyxy.cpu().numpy()
+            th, tw = crop.shape[:2]
+
+            # Boxes touching a tile edge that is not an image edge are
+            # (possibly) cut-off digits
+            cut = np.zeros(len(xyxy), dtype=bool)
+            if x > 0:
+                cut |= xyxy[:, 0] <= TILE_EDGE_MARGIN
+            if y > 0:
+                cut |= xyxy[:, 1] <= TILE_EDGE_MARGIN
+            if x + tw < w:
+                cut |= xyxy[:, 2] >= tw - TILE_EDGE_MARGIN
+            if y + th < h:
+                cut |= xyxy[:, 3] >= th - TILE_EDGE_MARGIN
+
+            all_boxes.append(xyxy + np.array([x, y, x, y], dtype=xyxy.dtype))
+            all_scores.append(result.boxes.conf.cpu().numpy())
+            all_classes.append(result.boxes.cls.cpu().numpy().astype(np.int64))
+            all_cut.append(cut)
+
+    if not all_boxes:
+        empty = np.zeros((0, 4), dtype=np.float32)
+        return empty, np.zeros(0, np.float32), np.zeros(0, np.int64), len(origins)
+
+    boxes = np.concatenate(all_boxes)
+    scores = np.concatenate(all_scores)
+    classes = np.concatenate(all_classes)
+    cut = np.concatenate(all_cut)
+    whole, pieces = np.flatnonzero(~cut), np.flatnonzero(cut)
+    keep = np.concatenate([whole[nms(boxes[whole], scores[whole], classes[whole])],
+                           pieces[top_per_class(scores[pieces], classes[pieces])]])
+    boxes, scores, classes = merge_cut_boxes(
+        boxes[keep], scores[keep], classes[keep], cut[keep])
+    order = np.argsort(-scores, kind="stable")
+    return boxes[order], scores[order], classes[order], len(origins)
+
+
+def draw_detections(image, boxes, scores, classes, class_names):
+    """Annotate a copy of a BGR image (same look as result.plot())."""
+    import cv2
+
+    out = image.copy()
+    for (x1, y1, x2, y2), score, cls_id in zip(boxes.astype(int), scores, classes):
+        label = f"{class_names.get(int(cls_id), f'class_{cls_id}')} {score:.2f}"
+        cv2.rectangle(out, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(out, label, (x1, max(y1 - 4, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    return out
+
 # ============================================================================
 # INFERENCE
 # ============================================================================
@@ -58,12 +243,19 @@ def run_inference():
             print("or set MODEL_PATH manually.")
             return
 
-    if not os.path.exists(model_path):
+    if not model_registry.resolve_model_path(model_path).exists():
         print(f"Error: Model not found: {model_path}")
         return
 
+    profiler = StageProfiler(PROFILE, PROFILE_CPROFILE, PROFILE_TRACEMALLOC)
+
+    # Heavy imports deferred until a model is actually run
+    with profiler.stage("imports"):
+        import cv2
+
     print(f"\nLoading model: {model_path}")
-    model = YOLO(model_path)
+    with profiler.stage("model load"):
+        model = model_registry.load_model(model_path)
 
     # Class names (fallback if model.names missing)
     class_names = (
@@ -72,46 +264,102 @@ def run_inference():
         else {0: "0", 1: "4", 2: "7"}
     )
 
-    # Collect test images
-    image_paths = []
-    for ext in ("*.jpg", "*.jpeg", "*.png", "*.JPG", "*.JPEG", "*.PNG"):
-        image_paths.extend(glob.glob(os.path.join(TEST_DIR, ext)))
+    # Collect test images as (name, loader) pairs
+    if USE_SHARDS:
+        import dataset_shards
+
+        shards = dataset_shards.ShardDataset(SHARD_DIR, SHARD_SPLIT)
+        images = [(name, lambda i=i: shards.image(i))
+                  for i, name in enumerate(shards.names)]
+        source = f"{SHARD_DIR}/{SHARD_SPLIT}"
+    else:
+        image_paths = []
+        for ext in ("*.jpg", "*.jpeg", "*.png", "*.JPG", "*.JPEG", "*.PNG"):
+            image_paths.extend(glob.glob(os.path.join(TEST_DIR, ext)))
+        images = [(os.path.basename(p), lambda p=p: cv2.imread(p))
+                  for p in sorted(image_paths)]
+        source = TEST_DIR
 
-    if not image_paths:
-        print(f"No images found in {TEST_DIR}")
+    if not images:
+        print(f"No images found in {source}")
         return
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    print(f"\nRunning inference on {len(image_paths)} images")
+    print(f"\nRunning inference on {len(images)} images")
     print(f"Saving annotated images to: {OUTPUT_DIR}")
     print("=" * 70)
 
-    for idx, img_path in enumerate(sorted(image_paths), 1):
-        img_name = os.path.basename(img_path)
-        print(f"[{idx}/{len(image_paths)}] {img_name}")
+    total_pixels = 0
+    predict_time = 0.0
 
-        results = model(img_path, conf=CONF_THRESHOLD)
-        result = results[0]
-
-        # Save annotated image (newer YOLO versions)
+    for idx, (img_name, load_image) in enumerate(images, 1):
+        print(f"[{idx}/{len(images)}] {img_name}")
         out_path = os.path.join(OUTPUT_DIR, f"result_{img_name}")
-        annotated = result.plot()
-        cv2.imwrite(out_path, annotated)
-        
-        # Print detections
-        if result.boxes is not None and len(result.boxes) > 0:
+
+        with profiler.stage("image load"):
+            image = load_image()
+        if image is None:
+            print("  Could not read image, skipped")
+            continue
+        h, w = image.shape[:2]
+        total_pixels += h * w
+
+        if TILED and max(h, w) > TILE_SIZE:
+            start = time.perf_counter()
+            with profiler.stage("predict (total)"):
+                boxes, scores, classes, n_tiles = detect_tiled(
+                    model, image, conf=CONF_THRESHOLD, profiler=profiler
+                )
+            predict_time += time.perf_counter() - start
+            print(f"  {w}x{h} -> {n_tiles} tiles")
+
+            with profiler.stage("plot"):
+                annotated = draw_detections(image, boxes, scores, classes, class_names)
+            detections = list(zip(classes.tolist(), scores.tolist()))
+        else:
+            start = time.perf_counter()
+            with profiler.stage("predict (total)"):
+                results = model(image, conf=CONF_THRESHOLD)
+            predict_time += time.perf_counter() - start
+            result = results[0]
+            record_speed(profiler, result.speed, 1)
+
+            # Save annotated image (newer YOLO versions)
+            with profiler.stage("plot"):
+                annotated = result.plot()
             detections = []
-            for box in result.boxes:
-                cls_id = int(box.cls[0].item())
-                conf = float(box.conf[0].item())
-                label = class_names.get(cls_id, f"class_{cls_id}")
-                detections.append(f"{label} ({conf:.2%})")
-            print(f"  Detections: {', '.join(detections)}")
+            if result.boxes is not None:
+                for box in result.boxes:
+                    detections.append((int(box.cls[0].item()), float(box.conf[0].item())))
+
+        profiler.count("images")
+        with profiler.stage("disk write"):
+            cv2.imwrite(out_path, annotated)
+
+        # Print detections
+        if detections:
+            profiler.count("detections", len(detections))
+            labels = [
+                f"{class_names.get(cls_id, f'class_{cls_id}')} ({conf:.2%})"
+                for cls_id, conf in detections
+            ]
+            print(f"  Detections: {', '.join(labels)}")
         else:
             print("  No detections")
 
     print("=" * 70)
+    if predict_time > 0:
+        print(f"Throughput: {total_pixels / 1e6 / predict_time:.2f} MP/s "
+              f"({total_pixels / 1e6:.1f} MP in {predict_time:.2f} s"
+              f"{', tiled' if TILED else ''})")
+
+    # Report goes next to results.csv of the model's experiment
+    exp_dir = model_registry.resolve_model_path(model_path).parent.parent
+    report_path = profiler.write_report(exp_dir, "infer")
+    if report_path:
+        print(f"✓ Timing report: {report_path}")
+
     print("\n✓ Inference complete")
     print(f"✓ Annotated images saved to: {OUTPUT_DIR}")
     print("You can now select figures for your report.")
@@ -0,0 +1,464 @@
+"""
+Live Detection - run the best digit detector on the ESP32 CAM frame stream
+
+Compatible with:
+- Python 3.11
+- ultralytics >= 8.3.0
+
+USAGE:
+    python live_detect.py                          # serial port (PORT below)
+    python live_detect.py --source replay --replay frames.bin
+    python live_detect.py --source fake --kind q1 --fps 10
+
+    Frames use the serial link framing (0xAA 0x55 + <I length + payload):
+      q3: JPEG frames from esp32_cam_q3 (160x120)
+      q1: 96x96 binary frames from esp32_cam_q1 (raw or compact formats)
+    Recordings written by esp32_cam_q1/receive.py (RECORD_PATH) use the same
+    framing and can be replayed. The fake source builds frames from
+    TEST_DIR images the way the firmware would and paces them at --fps.
+
+    Frames that match the last detected frame (frame_gate.py) are dropped
+    before detection. Only the newest frame is kept: when inference falls behind, older frames
+    are skipped instead of queueing up. Latency is measured from the moment
+    the sync word is read to the moment the detections are available.
+"""
+
+import io
+import sys
+import glob
+import time
+import struct
+import argparse
+import threading
+from pathlib import Path
+
+import model_registry
+from profiling import StageProfiler, record_speed
+
+# q1 frame decoding/thresholding, the change gate and perf_stats live in python/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from perf_stats import percentile  # noqa: E402
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+MODEL_PATH = None  # Set manually if needed
+SOURCE = "serial"  # "serial", "replay" or "fake"
+FRAME_KIND = "q3"  # "q3" (JPEG) or "q1" (binary mask)
+
+PORT = "COM4"
+BAUD = 921600
+
+REPLAY_PATH = None        # Recording to replay with SOURCE = "replay"
+REPLAY_FPS = 1.0          # Pace of replayed/fake frames (about what the ESP32 sends)
+FAKE_IMAGE_DIR = "images/test"
+LOOP = False              # Restart replay/fake sources when they run out
+
+IMGSZ = 320
+CONF_THRESHOLD = 0.25
+STATS_INTERVAL = 5.0      # Seconds between summary lines
+
+# Skip frames that match the last detected frame (static bench scenes)
+CHANGE_GATE = True
+CHANGE_THRESHOLD = 4.0    # q3: mean abs thumbnail difference (0..255), see frame_gate.py
+CHANGE_PIXELS = 16        # q1: changed mask pixels
+
+Q1_SIZE = (96, 96)
+Q3_SIZE = (160, 120)      # FRAMESIZE_QQVGA
+
+# Opt-in profiling: timing_live.txt is written into the model's experiment folder
+PROFILE = False
+PROFILE_CPROFILE = False
+PROFILE_TRACEMALLOC = False
+
+SYNC = b'\xAA\x55'
+
+# ============================================================================
+# FRAME SOURCES
+# ============================================================================
+def read_frame_timed(ser):
+    """
+    Read one framed payload, resynchronizing on the sync word.
+    Returns (payload, t_sync) with t_sync = time.perf_counter() when the
+    sync word was seen, or None on timeout / incomplete frame.
+    """
+
+    prev = b''
+    while True:
+        byte = ser.read(1)
+        if not byte:
+            return None
+        if prev == b'\xAA' and byte == b'\x55':
+            break
+        prev = byte
+    t_sync = time.perf_counter()
+
+    size_bytes = ser.read(4)
+    if len(size_bytes) != 4:
+        return None
+    size = struct.unpack("<I", size_bytes)[0]
+
+    data = ser.read(size)
+    if len(data) != size:
+        print("Incomplete frame")
+        return None
+
+    return data, t_sync
+
+
+def frame_bytes(payload):
+    return SYNC + struct.pack("<I", len(payload)) + payload
+
+
+def load_recording(path):
+    """Split a recording (serial link framing) into payloads."""
+    data = Path(path).read_bytes()
+    payloads = []
+    pos = data.find(SYNC)
+    while pos != -1 and pos + 6 <= len(data):
+        size = struct.unpack_from("<I", data, pos + 2)[0]
+        payload = data[pos + 6:pos + 6 + size]
+        if len(payload) != size:
+            break
+        payloads.append(payload)
+        pos = data.find(SYNC, pos + 6 + size)
+    return payloads
+
+
+def fake_payloads(image_dir=FAKE_IMAGE_DIR, kind=FRAME_KIND):
+    """Encode images the way the firmware does (q1 mask or q3 JPEG)."""
+    from PIL import Image
+
+    paths = []
+    for ext in ("*.jpg", "*.jpeg", "*.png"):
+        paths.extend(glob.glob(str(Path(image_dir) / ext)))
+
+    payloads = []
+    for path in sorted(paths):
+        image = Image.open(path).convert("RGB")
+        if kind == "q1":
+            from q1 import fused_threshold
+
+            mask, _ = fused_threshold(image, Q1_SIZE)
+            payloads.append(bytes(mask))
+        else:
+            buf = io.BytesIO()
+            image.resize(Q3_SIZE).save(buf, format="JPEG", quality=90)
+            payloads.append(buf.getvalue())
+    return payloads
+
+
+class FakeSerial:
+    """
+    Stand-in for serial.Serial that serves framed payloads at a fixed rate.
+    Only read() and close() are implemented, which is all the readers use.
+    """
+
+    def __init__(self, payloads, fps=REPLAY_FPS, loop=LOOP, timeout=1.0):
+        if not payloads:
+            raise ValueError("FakeSerial needs at least one payload")
+        self.payloads = payloads
+        self.interval = 1.0 / fps if fps else 0.0
+        self.loop = loop
+        self.timeout = timeout
+        self.exhausted = False
+
+        self._buf = bytearray()
+        self._next = 0
+        self._due = None  # Clock starts at the first read, like a cable plugged in
+
+    def _feed(self):
+        if self._next >= len(self.payloads):
+            if not self.loop:
+                self.exhausted = True
+                return False
+            self._next = 0
+        if self._due is None:
+            self._due = time.perf_counter()
+        delay = self._due - time.perf_counter()
+        if delay > self.timeout:
+            time.sleep(self.timeout)
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        self._buf += frame_bytes(self.payloads[self._next])
+        self._next += 1
+        self._due += self.interval
+        return True
+
+    def read(self, size=1):
+        while len(self._buf) < size:
+            if not self._feed():
+                break
+        out = bytes(self._buf[:size])
+        del self._buf[:size]
+        return out
+
+    def close(self):
+        pass
+
+
+def open_source(source=SOURCE, kind=FRAME_KIND, replay_path=REPLAY_PATH,
+                fps=REPLAY_FPS, loop=LOOP):
+    if source == "serial":
+        import serial
+
+        ser = serial.Serial(PORT, BAUD, timeout=5, dsrdtr=False, rtscts=False)
+        ser.setDTR(False)
+        ser.setRTS(False)
+        return ser
+    if source == "replay":
+        if not replay_path:
+            raise ValueError("Set REPLAY_PATH (or --replay) to replay a recording")
+        return FakeSerial(load_recording(replay_path), fps, loop)
+    if source == "fake":
+        return FakeSerial(fake_payloads(FAKE_IMAGE_DIR, kind), fps, loop)
+    raise ValueError(f"Unknown source: {source}")
+
+# ============================================================================
+# LIVE DETECTION
+# ============================================================================
+class LatestFrame:
+    """Single-slot buffer: a new frame replaces any frame not yet taken."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self.skipped = 0
+        self.closed = False
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.skipped += 1
+            self._item = item
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Newest frame, or None once closed and drained (or on timeout)."""
+        with self._cond:
+            if self._item is None and not self.closed:
+                self._cond.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+
+def decode_payload(payload, kind=FRAME_KIND):
+    """Frame payload -> BGR image for the detector."""
+    import numpy as np
+    import cv2
+
+    if kind == "q1":
+        from q1 import decode_binary_frame
+
+        mask = np.array(decode_binary_frame(payload, *Q1_SIZE), dtype=np.uint8)
+        return cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
+
+    image = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Corrupt JPEG frame")
+    return image
+
+
+class LiveDetector:
+    """
+    reader thread -> LatestFrame -> detector (caller's thread).
+    """
+
+    def __init__(self, model, ser, kind=FRAME_KIND, conf=CONF_THRESHOLD,
+                 imgsz=IMGSZ, profiler=None, change_gate=CHANGE_GATE,
+                 change_threshold=CHANGE_THRESHOLD, change_pixels=CHANGE_PIXELS):
+        from frame_gate import FrameChangeGate
+
+        self.model = model
+        self.ser = ser
+        self.kind = kind
+        self.conf = conf
+        self.imgsz = imgsz
+        self.profiler = profiler or StageProfiler()
+
+        self.slot = LatestFrame()
+        self.gate = (FrameChangeGate(change_threshold, pixel_threshold=change_pixels)
+                     if change_gate else None)
+        self.stop_event = threading.Event()
+        self.counts = {"read": 0, "detected": 0, "unchanged": 0, "errors": 0}
+        self.latencies = []
+        self._reader_thread = None
+
+        self.class_names = (
+            model.names
+            if hasattr(model, "names") and model.names
+            else {0: "0", 1: "4", 2: "7"}
+        )
+
+    def _reader(self):
+        frame_no = 0
+        while not self.stop_event.is_set():
+            frame = read_frame_timed(self.ser)
+            if frame is None:
+                if getattr(self.ser, "exhausted", False):
+                    break
+                continue
+            frame_no += 1
+            self.counts["read"] += 1
+            if self.gate and not self._changed(frame[0]):
+                self.counts["unchanged"] += 1
+                continue
+            self.slot.put((frame_no,) + frame)
+        self.slot.close()
+
+    def _changed(self, payload):
+        try:
+            if self.kind == "q1":
+                from q1 import decode_binary_frame
+
+                return self.gate.check_mask(decode_binary_frame(payload, *Q1_SIZE))
+            return self.gate.check_jpeg(payload)
+        except Exception:
+            return True  # Corrupt frames are reported by detect()
+
+    def detect(self, frame_no, payload, t_sync):
+        """Run the model on one frame; returns a result dict."""
+        with self.profiler.stage("decode"):
+            image = decode_payload(payload, self.kind)
+        with self.profiler.stage("predict (total)"):
+            result = self.model(image, imgsz=self.imgsz, conf=self.conf, verbose=False)[0]
+        latency = time.perf_counter() - t_sync
+        record_speed(self.profiler, result.speed, 1)
+
+        detections = []
+        if result.boxes is not None:
+            for box in result.boxes:
+                cls_id = int(box.cls[0].item())
+                detections.append((
+                    self.class_names.get(cls_id, f"class_{cls_id}"),
+                    float(box.conf[0].item()),
+                    [round(v, 1) for v in box.xyxy[0].tolist()],
+                ))
+        return {"frame": frame_no, "latency": latency, "detections": detections}
+
+    def warmup(self):
+        """First call builds the predictor; keep it out of frame latencies."""
+        import numpy as np
+
+        with self.profiler.stage("warm-up"):
+            self.model(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8),
+                       imgsz=self.imgsz, verbose=False)
+
+    def run(self, max_frames=None, on_result=None):
+        """Detect until the source ends, max_frames results, or Ctrl+C."""
+        self.warmup()
+        self._reader_thread = threading.Thread(target=self._reader, name="reader", daemon=True)
+        self._reader_thread.start()
+        last_stats = time.monotonic()
+
+        try:
+            while max_frames is None or self.counts["detected"] < max_frames:
+                item = self.slot.get(timeout=0.5)
+                if item is None:
+                    if self.slot.closed:
+                        break
+                    continue
+                try:
+                    result = self.detect(*item)
+                except Exception as e:
+                    self.counts["errors"] += 1
+                    print(f"Frame #{item[0]} failed: {e}")
+                    continue
+
+                self.counts["detected"] += 1
+                self.latencies.append(result["latency"])
+                (on_result or print_result)(result)
+
+                if time.monotonic() - last_stats >= STATS_INTERVAL:
+                    print(format_stats(self.stats()))
+                    last_stats = time.monotonic()
+        except KeyboardInterrupt:
+            print("\nStopped by user.")
+        finally:
+            self.stop_event.set()
+        return self.stats()
+
+    def stats(self):
+        stats = dict(self.counts)
+        stats["skipped"] = self.slot.skipped
+        stats["latency_mean"] = (sum(self.latencies) / len(self.latencies)
+                                 if self.latencies else 0.0)
+        stats["latency_p95"] = percentile(self.latencies, 95)
+        stats["latency_max"] = max(self.latencies, default=0.0)
+        return stats
+
+
+def print_result(result):
+    dets = ", ".join(f"{label} ({conf:.0%})" for label, conf, _ in result["detections"])
+    print(f"Frame #{result['frame']:05d} | {result['latency'] * 1000:7.1f} ms | "
+          f"{dets or 'no detections'}")
+
+
+def format_stats(stats):
+    return (f"read={stats['read']} detected={stats['detected']} "
+            f"skipped={stats['skipped']} unchanged={stats['unchanged']} errors={stats['errors']} | latency "
+            f"mean={stats['latency_mean'] * 1000:.1f} ms "
+            f"p95={stats['latency_p95'] * 1000:.1f} ms "
+            f"max={stats['latency_max'] * 1000:.1f} ms")
+
+# ============================================================================
+# MAIN
+# ============================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live digit detection on ESP32 CAM frames")
+    parser.add_argument("--source", choices=("serial", "replay", "fake"), default=SOURCE)
+    parser.add_argument("--kind", choices=("q1", "q3"), default=FRAME_KIND)
+    parser.add_argument("--replay", default=REPLAY_PATH, help="recording to replay")
+    parser.add_argument("--fps", type=float, default=REPLAY_FPS,
+                        help="frame rate of replay/fake sources")
+    parser.add_argument("--loop", action="store_true", default=LOOP)
+    parser.add_argument("--model", default=MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    print("=" * 70)
+    print("LIVE DETECTION")
+    print("=" * 70)
+
+    model_path = args.model
+    if not model_path:
+        best = model_registry.best_experiment()
+        if not best:
+            print("Error: Could not determine best model.")
+            print("Run train.py first, or set MODEL_PATH manually.")
+            return
+        model_path = best["model_path"]
+    if not model_registry.resolve_model_path(model_path).exists():
+        print(f"Error: Model not found: {model_path}")
+        return
+
+    profiler = StageProfiler(PROFILE, PROFILE_CPROFILE, PROFILE_TRACEMALLOC)
+    print(f"Loading model: {model_path}")
+    with profiler.stage("model load"):
+        model = model_registry.load_model(model_path)
+
+    ser = open_source(args.source, args.kind, args.replay, args.fps, args.loop)
+    live = LiveDetector(model, ser, args.kind, profiler=profiler)
+
+    print(f"Source: {args.source} ({args.kind} frames). Press Ctrl+C to stop.")
+    try:
+        stats = live.run()
+    finally:
+        ser.close()
+
+    print("=" * 70)
+    print(format_stats(stats))
+
+    exp_dir = model_registry.resolve_model_path(model_path).parent.parent
+    report_path = profiler.write_report(exp_dir, "live")
+    if report_path:
+        print(f"✓ Timing report: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Model Registry - shared experiment index for train/test/infer
+
+USAGE:
+    import model_registry
+
+    best = model_registry.best_experiment()        # dict or None
+    model = model_registry.load_model(best["model_path"])
+
+    The index lives in hyperparameter_results/model_index.json and stores,
+    per experiment: hyperparameters, validation metrics, the weight path
+    (normalized to forward slashes, relative to this folder) and the
+    SHA-256 of the weight file. The best experiment is kept under "best",
+    so lookup does not rescan anything. If the index is missing or older
+    than validation_metrics.csv it is rebuilt from the CSV in memory; only
+    register_experiments() (train.py) writes it. Loaded indexes are kept
+    per process until either file changes.
+
+    The SHA-256 is recorded by register_experiments(), right after
+    training wrote the weights, and load_model() checks the weight file
+    against it. Entries rebuilt from the CSV carry no hash (hashing the
+    current files would only confirm themselves) and are not verified.
+"""
+
+import os
+import csv
+import copy
+import json
+import hashlib
+from pathlib import Path
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+BASE_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BASE_DIR / "hyperparameter_results"
+INDEX_PATH = RESULTS_DIR / "model_index.json"
+METRICS_CSV = RESULTS_DIR / "validation_metrics.csv"
+
+SELECTION_METRIC = "mAP50"
+INDEX_VERSION = 1
+
+# Loaded YOLO models, keyed by (resolved path, mtime, size)
+_MODEL_CACHE = {}
+# Loaded indexes, keyed by (index path, CSV path) -> (file mtimes, index)
+_INDEX_CACHE = {}
+
+# ============================================================================
+# PATHS AND HASHES
+# ============================================================================
+def normalize_model_path(path):
+    """
+    Store paths portably: forward slashes, relative to BASE_DIR when possible.
+    Windows paths such as 'hyperparameter_results\\exp_3\\weights\\best.pt'
+    become 'hyperparameter_results/exp_3/weights/best.pt'.
+    """
+    path = str(path).replace("\\", "/")
+    p = Path(path)
+    if p.is_absolute():
+        try:
+            return p.resolve().relative_to(BASE_DIR).as_posix()
+        except ValueError:
+            return p.as_posix()
+    return p.as_posix()
+
+
+def resolve_model_path(path):
+    """Absolute path for a stored (normalized) model path."""
+    p = Path(normalize_model_path(path))
+    return p if p.is_absolute() else BASE_DIR / p
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    path = Path(path)
+    if not path.exists():
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# ============================================================================
+# INDEX
+# ============================================================================
+def _entry_from_result(result, hash_weights=True):
+    model_path = normalize_model_path(result["model_path"])
+    return {
+        "experiment_id": int(result["experiment_id"]),
+        "name": result["name"],
+        "learning_rate": float(result["learning_rate"]),
+        "batch_size": int(result["batch_size"]),
+        "image_size": int(result.get("image_size") or 320),
+        "mAP50": float(result["mAP50"]),
+        "mAP50_95": float(result["mAP50_95"]),
+        "precision": float(result["precision"]),
+        "recall": float(result["recall"]),
+        "model_path": model_path,
+        "sha256": file_sha256(resolve_model_path(model_path)) if hash_weights else None,
+    }
+
+
+def _pick_best(experiments):
+    if not experiments:
+        return None
+    # First maximum wins, matching DataFrame.idxmax on the CSV
+    return max(experiments.values(), key=lambda e: e[SELECTION_METRIC])["name"]
+
+
+def save_index(index, path=None):
+    """Write the index atomically (temp file + rename)."""
+    path = Path(path or INDEX_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, path)
+
+
+def build_index_from_csv(csv_path=None):
+    """
+    Build an index from a validation_metrics.csv written by train.py.
+    Weights are not hashed (no recorded hash to trust), so this is cheap.
+    """
+    csv_path = Path(csv_path or METRICS_CSV)
+    if not csv_path.exists():
+        return None
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+
+    experiments = {}
+    for row in rows:
+        entry = _entry_from_result(row, hash_weights=False)
+        experiments[entry["name"]] = entry
+
+    return {
+        "version": INDEX_VERSION,
+        "metric": SELECTION_METRIC,
+        "best": _pick_best(experiments),
+        "experiments": experiments,
+    }
+
+
+def _mtime(path):
+    return path.stat().st_mtime_ns if path.exists() else None
+
+
+def load_index(path=None, csv_path=None):
+    """
+    Load the index. A missing index, or one older than the CSV (train.py
+    ran without registering), is rebuilt from the CSV but not saved.
+    The result is reused until the index or the CSV changes on disk;
+    treat it as read-only.
+    """
+    path = Path(path or INDEX_PATH)
+    csv_path = Path(csv_path) if csv_path else path.parent / METRICS_CSV.name
+    key = (str(path), str(csv_path))
+    mtimes = (_mtime(path), _mtime(csv_path))
+    cached = _INDEX_CACHE.get(key)
+    if cached and cached[0] == mtimes:
+        return cached[1]
+
+    index_mtime, csv_mtime = mtimes
+    if index_mtime is not None and (csv_mtime is None or csv_mtime <= index_mtime):
+        with open(path, encoding="utf-8") as f:
+            index = json.load(f)
+    else:
+        index = build_index_from_csv(csv_path)
+    _INDEX_CACHE[key] = (mtimes, index)
+    return index
+
+
+def register_experiments(results, path=None):
+    """
+    Add or replace experiments (result dicts from train.run_experiment)
+    and update the best entry. Returns the updated index.
+    """
+    path = Path(path or INDEX_PATH)
+    index = copy.deepcopy(load_index(path))
+    if index is None:
+        index = {
+            "version": INDEX_VERSION,
+            "metric": SELECTION_METRIC,
+            "best": None,
+            "experiments": {},
+        }
+
+    for result in results:
+        entry = _entry_from_result(result)
+        index["experiments"][entry["name"]] = entry
+
+    index["best"] = _pick_best(index["experiments"])
+    save_index(index, path)
+    return index
+
+
+def best_experiment(index=None):
+    """Best experiment entry (dict) or None if nothing is registered."""
+    if index is None:
+        index = load_index()
+    if not index or not index.get("best"):
+        return None
+    return index["experiments"][index["best"]]
+
+# ============================================================================
+# MODEL LOADING
+# ============================================================================
+def registered_sha256(model_path, index=None):
+    """
+    SHA-256 recorded for a weight file by register_experiments(), or None
+    (unknown file, or an entry rebuilt from the CSV).
+    """
+    if index is None:
+        index = load_index()
+    if not index:
+        return None
+    target = resolve_model_path(model_path)
+    for entry in index["experiments"].values():
+        if resolve_model_path(entry["model_path"]) == target:
+            return entry.get("sha256")
+    return None
+
+
+def load_model(model_path, verify=True):
+    """
+    Load a YOLO model once per process. Repeated calls for an unchanged
+    weight file return the same warm model object.
+
+    On a cache miss a weight file with a recorded SHA-256 (see
+    registered_sha256) is hashed and compared with it; a mismatch
+    (weights replaced after training) raises ValueError.
+    """
+    path = resolve_model_path(model_path)
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+
+    model = _MODEL_CACHE.get(key)
+    if model is None:
+        from ultralytics import YOLO
+
+        expected = registered_sha256(path) if verify else None
+        if expected and file_sha256(path) != expected:
+            raise ValueError(
+                f"{normalize_model_path(model_path)} does not match the SHA-256 "
+                f"recorded in {INDEX_PATH.name}; re-run train.py or pass verify=False"
+            )
+
+        model = YOLO(str(path))
+        _MODEL_CACHE[key] = model
+    return model
+
+
+def clear_model_cache():
+    _MODEL_CACHE.clear()
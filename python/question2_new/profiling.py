@@ -0,0 +1,279 @@
+"""
+Per-stage profiling hooks for train/test/infer
+
+USAGE:
+    from profiling import StageProfiler
+
+    profiler = StageProfiler(enabled=True, use_cprofile=False, use_tracemalloc=False)
+    with profiler.stage("model load"):
+        model = YOLO(path)
+    profiler.count("images")
+    profiler.write_report(exp_dir, "infer")   # -> exp_dir/timing_infer.txt
+
+    Disabled profilers turn every call into a no-op, so the hooks can stay
+    in the scripts permanently. attach_ultralytics_callbacks() splits
+    model.train()/model.val() into dataset setup, data wait, batch compute
+    and validation using the ultralytics callback hooks.
+"""
+
+import io
+import time
+import pstats
+import cProfile
+import tracemalloc
+from pathlib import Path
+from contextlib import contextmanager
+
+# Number of allocation sites listed in the tracemalloc section
+TRACEMALLOC_TOP = 15
+# Number of functions listed in the cProfile section
+CPROFILE_TOP = 25
+
+
+class StageProfiler:
+    """Accumulates wall time, call counts and (optionally) memory per stage."""
+
+    def __init__(self, enabled=False, use_cprofile=False, use_tracemalloc=False):
+        self.enabled = enabled
+        self.use_cprofile = enabled and use_cprofile
+        self.use_tracemalloc = enabled and use_tracemalloc
+
+        self.stages = {}    # name -> [calls, total_s, max_s, peak_bytes]
+        self.counters = {}  # name -> count
+        self.order = []
+        self.start_time = time.perf_counter()
+
+        self._profile = cProfile.Profile() if self.use_cprofile else None
+        self._profile_depth = 0
+        if self.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+    def add(self, name, seconds, calls=1, peak_bytes=0):
+        """Record a duration measured elsewhere (e.g. ultralytics speed dicts)."""
+        if not self.enabled:
+            return
+        s = self.stages.get(name)
+        if s is None:
+            s = self.stages[name] = [0, 0.0, 0.0, 0]
+            self.order.append(name)
+        s[0] += calls
+        s[1] += seconds
+        s[2] = max(s[2], seconds / calls if calls else seconds)
+        s[3] = max(s[3], peak_bytes)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        if self._profile is not None:
+            if self._profile_depth == 0:
+                self._profile.enable()
+            self._profile_depth += 1
+        if self.use_tracemalloc:
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.use_tracemalloc else 0
+            if self._profile is not None:
+                self._profile_depth -= 1
+                if self._profile_depth == 0:
+                    self._profile.disable()
+            self.add(name, elapsed, peak_bytes=peak)
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def report(self, title=""):
+        wall = time.perf_counter() - self.start_time
+        lines = []
+        if title:
+            lines += [title, "=" * 70]
+        lines.append(f"Total wall time: {wall:.3f} s")
+        lines.append("")
+        lines.append(f"{'Stage':<28}{'Calls':>7}{'Total s':>11}{'Mean ms':>11}"
+                     f"{'Max ms':>11}{'% wall':>8}"
+                     + (f"{'Peak MB':>10}" if self.use_tracemalloc else ""))
+        lines.append("-" * (76 + (10 if self.use_tracemalloc else 0)))
+        for name in self.order:
+            calls, total, longest, peak = self.stages[name]
+            mean_ms = total / calls * 1000 if calls else 0.0
+            share = total / wall * 100 if wall else 0.0
+            row = (f"{name:<28}{calls:>7}{total:>11.3f}{mean_ms:>11.2f}"
+                   f"{longest * 1000:>11.2f}{share:>7.1f}%")
+            if self.use_tracemalloc:
+                row += f"{peak / 1e6:>10.2f}"
+            lines.append(row)
+
+        if self.counters:
+            lines.append("")
+            lines.append("Counters:")
+            for name, value in self.counters.items():
+                lines.append(f"  {name}: {value}")
+
+        if self._profile is not None:
+            buf = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=buf)
+            stats.sort_stats("cumulative").print_stats(CPROFILE_TOP)
+            lines += ["", "cProfile (cumulative, inside stages):", buf.getvalue()]
+
+        if self.use_tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            lines += ["", f"tracemalloc top {TRACEMALLOC_TOP} allocation sites:"]
+            for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                lines.append(f"  {stat}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, out_dir, run_name):
+        """
+        Write timing_<run_name>.txt (and profile_<run_name>.prof when
+        cProfile is on) into out_dir. Returns the report path or None.
+        """
+        if not self.enabled:
+            return None
+
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        report_path = out_dir / f"timing_{run_name}.txt"
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(self.report(f"TIMING REPORT - {run_name} ({stamp})"))
+
+        if self._profile is not None:
+            self._profile.dump_stats(str(out_dir / f"profile_{run_name}.prof"))
+
+        return report_path
+
+
+# ============================================================================
+# ULTRALYTICS INTEGRATION
+# ============================================================================
+def record_speed(profiler, speed, n_images, prefix=""):
+    """
+    Add an ultralytics speed dict (ms per image for preprocess, inference,
+    loss, postprocess/NMS) to the profiler as totals over n_images.
+    """
+    names = {
+        "preprocess": "preprocess",
+        "inference": "forward pass",
+        "loss": "loss",
+        "postprocess": "NMS / postprocess",
+    }
+    for key, label in names.items():
+        ms = speed.get(key) if speed else None
+        if ms is not None:
+            profiler.add(prefix + label, ms * n_images / 1000, calls=n_images)
+
+
+class _ProfilerProxy:
+    # Forwards to whichever profiler is currently attached to the model
+    def __init__(self, model):
+        self.model = model
+
+    def add(self, *args, **kwargs):
+        self.model._stage_profiler.add(*args, **kwargs)
+
+    def count(self, *args, **kwargs):
+        self.model._stage_profiler.count(*args, **kwargs)
+
+
+def attach_ultralytics_callbacks(model, profiler):
+    """
+    Split model.train()/model.val() into stages via callbacks:
+      dataset setup, data wait (loader), train step (forward + backward +
+      optimizer), validation, val data wait, val batch.
+    """
+    if not profiler.enabled:
+        return
+
+    # Cached models are reused across runs: swap the target profiler
+    # instead of stacking a second set of callbacks
+    if getattr(model, "_stage_profiler", None) is not None:
+        model._stage_profiler = profiler
+        return
+    model._stage_profiler = profiler
+    profiler = _ProfilerProxy(model)
+
+    marks = {}
+
+    def mark(key):
+        marks[key] = time.perf_counter()
+
+    def since(key):
+        return time.perf_counter() - marks.get(key, time.perf_counter())
+
+    def on_pretrain_routine_start(_):
+        mark("setup")
+
+    def on_pretrain_routine_end(_):
+        profiler.add("dataset/dataloader setup", since("setup"))
+
+    def on_train_epoch_start(_):
+        mark("batch_end")
+        mark("epoch")
+
+    def on_train_batch_start(_):
+        profiler.add("train data wait", since("batch_end"))
+        mark("batch")
+
+    def on_train_batch_end(_):
+        profiler.add("train step", since("batch"))
+        profiler.count("train batches")
+        mark("batch_end")
+
+    def on_fit_epoch_end(_):
+        # Also fired once more by the trainer's final validation of best.pt
+        if "epoch" in marks:
+            profiler.add("epoch (train + val)", since("epoch"))
+            profiler.count("epochs")
+            del marks["epoch"]
+        else:
+            profiler.add("final eval (best.pt)", since("fit_end"))
+        mark("fit_end")
+
+    def on_train_end(_):
+        profiler.add("final plots", since("fit_end"))
+
+    def on_val_start(_):
+        mark("val")
+        mark("val_batch_end")
+
+    def on_val_batch_start(_):
+        profiler.add("val data wait", since("val_batch_end"))
+        mark("val_batch")
+
+    def on_val_batch_end(_):
+        profiler.add("val batch", since("val_batch"))
+        profiler.count("val batches")
+        mark("val_batch_end")
+
+    def on_val_end(_):
+        profiler.add("validation", since("val"))
+
+    for event, fn in (
+        ("on_pretrain_routine_start", on_pretrain_routine_start),
+        ("on_pretrain_routine_end", on_pretrain_routine_end),
+        ("on_train_epoch_start", on_train_epoch_start),
+        ("on_train_batch_start", on_train_batch_start),
+        ("on_train_batch_end", on_train_batch_end),
+        ("on_fit_epoch_end", on_fit_epoch_end),
+        ("on_train_end", on_train_end),
+        ("on_val_start", on_val_start),
+        ("on_val_batch_start", on_val_batch_start),
+        ("on_val_batch_end", on_val_batch_end),
+        ("on_val_end", on_val_end),
+    ):
+        model.add_callback(event, fn)
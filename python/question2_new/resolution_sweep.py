@@ -0,0 +1,312 @@
+"""
+Resolution Sweep - accuracy vs. cost of the detector over input sizes
+
+USAGE:
+    python resolution_sweep.py
+    python resolution_sweep.py --sizes 96 160 320 --floor 0.85
+    python resolution_sweep.py --retrain --epochs 20
+
+    Takes the best model from the registry (or --model) and, for every
+    size in RESOLUTIONS, measures on the test split:
+      - mAP50 / mAP50-95 (test.test_model at that imgsz)
+      - latency per image: model.predict on each test image, batch 1,
+        after LATENCY_WARMUP calls (median and p95 in ms)
+      - memory: process peak RSS, and the inference memory on top of the
+        loaded model: the peak RSS is reset (perf_stats.reset_peak_rss)
+        after loading, and the RSS before the first prediction is
+        subtracted from the peak reached while predicting (NaN where the
+        peak cannot be reset); plus peak CUDA memory on a GPU. Each size
+        runs in a fresh process (ISOLATE_MEMORY)
+    With --retrain the best model is first fine-tuned at each size
+    (best lr0/batch, RETRAIN_EPOCHS) and the fine-tuned weights are
+    evaluated instead.
+
+    Results go to hyperparameter_results/resolution_sweep.csv. Sizes on
+    the Pareto front (no other size is at least as accurate, as fast and
+    as small in inference memory, and strictly better in one of them) are
+    marked, and the fastest size with mAP50 >= MAP50_FLOOR (ties: least
+    inference memory) is recommended. Peak RSS is mostly the interpreter,
+    torch and the model, the same at every size, so the memory axis is
+    inference_mem_mb.
+    The ESP32 frames are 96x96 (q1) and 160x120 (q3), hence the small sizes.
+"""
+
+import os
+import sys
+import math
+import time
+import glob
+import argparse
+from pathlib import Path
+
+import model_registry
+
+# Shared rss_bytes/percentile helpers live in python/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from perf_stats import rss_bytes, reset_peak_rss, percentile  # noqa: E402
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+RESOLUTIONS = [96, 128, 160, 224, 320, 416]  # Multiples of the YOLO stride (32)
+MAP50_FLOOR = 0.9          # Accuracy the recommended size must reach
+MODEL_PATH = None          # None = best model from model_registry
+DATA_YAML = "data.yaml"
+RESULTS_DIR = Path("hyperparameter_results")
+TEST_DIR = "images/test"
+
+LATENCY_WARMUP = 3         # Untimed predictions before measuring
+LATENCY_PASSES = 3         # Timed passes over the test images
+ISOLATE_MEMORY = True      # One process per size for clean peak memory
+
+RETRAIN = False            # Fine-tune the best model at every size first
+RETRAIN_EPOCHS = 20
+RETRAIN_PROJECT = "resolution_sweep"
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+def test_images(test_dir=TEST_DIR):
+    import cv2
+
+    paths = []
+    for ext in ("*.jpg", "*.jpeg", "*.png"):
+        paths.extend(glob.glob(os.path.join(test_dir, ext)))
+    images = [cv2.imread(p) for p in sorted(paths)]
+    return [img for img in images if img is not None]
+
+
+def measure_latency(model, images, imgsz, device=None):
+    """Per-image predict latencies in ms (batch 1, decoded images)."""
+    kwargs = {"imgsz": imgsz, "verbose": False}
+    if device:
+        kwargs["device"] = device
+    for i in range(LATENCY_WARMUP):
+        model.predict(images[i % len(images)], **kwargs)
+
+    latencies = []
+    for _ in range(LATENCY_PASSES):
+        for image in images:
+            start = time.perf_counter()
+            model.predict(image, **kwargs)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def evaluate_resolution(model_path, imgsz, data_yaml=DATA_YAML, device=None):
+    """Accuracy, latency and peak memory of one model at one input size."""
+    import test
+
+    images = test_images()
+    if not images:
+        raise FileNotFoundError(f"No test images in {TEST_DIR}")
+
+    model = model_registry.load_model(model_path)
+    cuda = False
+    try:
+        import torch
+
+        cuda = torch.cuda.is_available() and device != "cpu"
+        if cuda:
+            torch.cuda.reset_peak_memory_stats()
+    except ImportError:
+        pass
+
+    # Prediction first: the peak RSS then reflects inference, not val().
+    # Importing torch and loading the checkpoint can peak above the
+    # steady-state RSS, so the peak restarts here
+    load_peak_rss = rss_bytes(peak=True)
+    base_rss = rss_bytes()
+    reset = reset_peak_rss()
+    latencies = measure_latency(model, images, imgsz, device)
+    peak_rss = rss_bytes(peak=True)
+    cuda_peak = torch.cuda.max_memory_allocated() if cuda else 0
+    inference_mem = max(peak_rss - base_rss, 0) / 1e6 if reset else float("nan")
+
+    metrics = test.test_model(model_path, data_yaml=data_yaml, imgsz=imgsz)
+    if not metrics:
+        raise RuntimeError(f"Evaluation failed at imgsz={imgsz}")
+
+    return {
+        "imgsz": imgsz,
+        "mAP50": metrics["mAP50"],
+        "mAP50_95": metrics["mAP50_95"],
+        "latency_ms": percentile(latencies, 50),
+        "latency_p95_ms": percentile(latencies, 95),
+        "images_per_s": 1000 * len(latencies) / sum(latencies),
+        "peak_rss_mb": max(peak_rss, load_peak_rss) / 1e6,
+        "inference_mem_mb": inference_mem,
+        "cuda_peak_mb": cuda_peak / 1e6,
+        "model_path": model_registry.normalize_model_path(model_path),
+    }
+
+
+def _evaluate_isolated(args):
+    # Runs in a fresh process, so VmHWM starts from zero for this size
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            return evaluate_resolution(*args)
+        finally:
+            sys.stdout = sys.__stdout__
+
+
+def run_isolated(model_path, imgsz, data_yaml=DATA_YAML, device=None):
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(_evaluate_isolated, ((model_path, imgsz, data_yaml, device),))
+
+# ============================================================================
+# RETRAINING
+# ============================================================================
+def retrain_at(best, imgsz, data_yaml=DATA_YAML, epochs=RETRAIN_EPOCHS):
+    """Fine-tune the best model at imgsz; returns the new best.pt path or None."""
+    import train
+
+    exp_config = {
+        "lr0": best["learning_rate"],
+        "batch": best["batch_size"],
+        "name": f"imgsz{imgsz}_{best['name']}",
+    }
+    # Keep the fine-tuned runs apart from the search results
+    search_dir = train.RESULTS_DIR
+    train.RESULTS_DIR = RESULTS_DIR / RETRAIN_PROJECT
+    try:
+        result = train.run_experiment(
+            exp_config, 0, data_yaml,
+            model_source=model_registry.resolve_model_path(best["model_path"]),
+            epochs=epochs, imgsz=imgsz,
+            warmup_epochs=train.FORK_LR_WARMUP_EPOCHS,
+        )
+    finally:
+        train.RESULTS_DIR = search_dir
+    return result["model_path"] if result else None
+
+# ============================================================================
+# PARETO TABLE
+# ============================================================================
+def _memory(row):
+    # Unmeasured inference memory (NaN) drops out of the comparison
+    mem = row["inference_mem_mb"]
+    return 0.0 if math.isnan(mem) else mem
+
+
+def mark_pareto(rows):
+    """Flag rows no other row beats on mAP50, latency and inference memory."""
+    def dominates(a, b):
+        at_least = (a["mAP50"] >= b["mAP50"] and a["latency_ms"] <= b["latency_ms"]
+                    and _memory(a) <= _memory(b))
+        better = (a["mAP50"] > b["mAP50"] or a["latency_ms"] < b["latency_ms"]
+                  or _memory(a) < _memory(b))
+        return at_least and better
+
+    for row in rows:
+        row["pareto"] = not any(dominates(other, row) for other in rows if other is not row)
+    return rows
+
+
+def recommend(rows, floor=MAP50_FLOOR):
+    """Fastest size meeting the accuracy floor (ties: least inference memory), or None."""
+    ok = [row for row in rows if row["mAP50"] >= floor]
+    return min(ok, key=lambda r: (r["latency_ms"], _memory(r))) if ok else None
+
+
+def format_table(rows, floor=MAP50_FLOOR):
+    lines = [
+        f"{'imgsz':>6}{'mAP50':>8}{'mAP50-95':>10}{'ms/img':>8}{'p95 ms':>8}"
+        f"{'img/s':>8}{'peak MB':>9}{'infer MB':>10}  pareto",
+        "-" * 75,
+    ]
+    for row in rows:
+        flag = "*" if row["pareto"] else ""
+        if row["mAP50"] < floor:
+            flag += " (below floor)"
+        lines.append(
+            f"{row['imgsz']:>6}{row['mAP50']:>8.4f}{row['mAP50_95']:>10.4f}"
+            f"{row['latency_ms']:>8.1f}{row['latency_p95_ms']:>8.1f}"
+            f"{row['images_per_s']:>8.1f}{row['peak_rss_mb']:>9.0f}"
+            f"{row['inference_mem_mb']:>10.1f}  {flag}"
+        )
+    return "\n".join(lines)
+
+# ============================================================================
+# MAIN
+# ============================================================================
+def sweep(sizes=RESOLUTIONS, model_path=MODEL_PATH, floor=MAP50_FLOOR,
+          retrain=RETRAIN, epochs=RETRAIN_EPOCHS, data_yaml=DATA_YAML,
+          isolate=ISOLATE_MEMORY, device=None):
+    best = model_registry.best_experiment()
+    if model_path is None:
+        if not best:
+            print("No model in the registry. Run train.py first or set MODEL_PATH.")
+            return None
+        model_path = best["model_path"]
+    if not model_registry.resolve_model_path(model_path).exists():
+        print(f"Model not found: {model_path}")
+        return None
+    if retrain and not best:
+        print("Retraining needs the best experiment's hyperparameters from train.py.")
+        return None
+
+    print(f"Resolution sweep of {model_path} over {list(sizes)}"
+          + (f" (fine-tuned {epochs} epochs per size)" if retrain else ""))
+    rows = []
+    for imgsz in sizes:
+        weights = retrain_at(best, imgsz, data_yaml, epochs) if retrain else model_path
+        if not weights:
+            print(f"  imgsz {imgsz}: retraining failed, skipped")
+            continue
+
+        if isolate:
+            row = run_isolated(weights, imgsz, data_yaml, device)
+        else:
+            row = evaluate_resolution(weights, imgsz, data_yaml, device)
+        rows.append(row)
+        print(f"  imgsz {imgsz}: mAP50 {row['mAP50']:.4f}, {row['latency_ms']:.1f} ms/img, "
+              f"inference {row['inference_mem_mb']:.1f} MB (peak {row['peak_rss_mb']:.0f} MB)")
+
+    if not rows:
+        return None
+    mark_pareto(rows)
+
+    import pandas as pd
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    out_csv = RESULTS_DIR / "resolution_sweep.csv"
+    pd.DataFrame(rows).to_csv(out_csv, index=False)
+
+    print("\n" + "=" * 75)
+    print(f"RESOLUTION SWEEP (test split, mAP50 floor {floor})")
+    print("=" * 75)
+    print(format_table(rows, floor))
+    choice = recommend(rows, floor)
+    if choice:
+        print(f"\n✓ Fastest size meeting the floor: imgsz {choice['imgsz']} "
+              f"(mAP50 {choice['mAP50']:.4f}, {choice['latency_ms']:.1f} ms/img)")
+    else:
+        print(f"\n✗ No size reaches mAP50 {floor}")
+    print(f"✓ Results saved to: {out_csv}")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Accuracy vs. cost over input resolution")
+    parser.add_argument("--sizes", type=int, nargs="+", default=RESOLUTIONS)
+    parser.add_argument("--model", default=MODEL_PATH, help="weights (default: registry best)")
+    parser.add_argument("--floor", type=float, default=MAP50_FLOOR, help="mAP50 floor")
+    parser.add_argument("--retrain", action="store_true", default=RETRAIN,
+                        help="fine-tune at every size before evaluating")
+    parser.add_argument("--epochs", type=int, default=RETRAIN_EPOCHS)
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--in-process", action="store_true",
+                        help="no subprocess per size (peak memory only grows)")
+    args = parser.parse_args(argv)
+
+    sweep(args.sizes, args.model, args.floor, args.retrain, args.epochs,
+          isolate=ISOLATE_MEMORY and not args.in_process, device=args.device)
+
+
+if __name__ == "__main__":
+    main()
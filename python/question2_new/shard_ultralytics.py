@@ -0,0 +1,151 @@
+"""
+Shard-backed datasets for ultralytics training and validation
+
+USAGE:
+    from shard_ultralytics import ShardDetectionTrainer, ShardDetectionValidator
+    from shard_ultralytics import write_shard_yaml
+
+    data_yaml = write_shard_yaml("shards")                  # val = val split
+    YOLO("yolov8n.pt").train(data=str(data_yaml), trainer=ShardDetectionTrainer)
+
+    data_yaml = write_shard_yaml("shards", val_split="test")
+    model.val(data=str(data_yaml), validator=ShardDetectionValidator)
+
+    The data.yaml points every split at its <split>.json manifest. The
+    trainer/validator build ShardYOLODataset for those paths: labels and
+    image sizes come from the packed index, and images are decoded from
+    the mmap shards (dataset_shards.ShardDataset) instead of loose files.
+    Augmentation, letterboxing and RAM caching are unchanged; cache="disk"
+    is ignored since there are no files to put .npy caches next to.
+"""
+
+import math
+from pathlib import Path
+
+import cv2
+
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer, DetectionValidator
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import unwrap_model
+
+from dataset_shards import ShardDataset, SPLITS, CLASS_NAMES
+
+
+def write_shard_yaml(shard_dir, val_split="val", out_path=None):
+    """data.yaml whose splits are shard manifests; val is val_split."""
+    shard_dir = Path(shard_dir).resolve()
+    out_path = Path(out_path or shard_dir / f"data_{val_split}.yaml")
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(f"path: {shard_dir.as_posix()}\n\n")
+        for split in SPLITS:
+            source = val_split if split == "val" else split
+            f.write(f"{split}: {source}.json\n")
+        f.write("\nnames:\n")
+        for cls_id, name in CLASS_NAMES.items():
+            f.write(f"  {cls_id}: {name}\n")
+    return out_path
+
+
+class ShardYOLODataset(YOLODataset):
+    """YOLODataset over one packed split; img_path is its <split>.json."""
+
+    def __init__(self, *args, img_path, cache=None, **kwargs):
+        manifest = Path(img_path)
+        self.shards = ShardDataset(manifest.parent, manifest.stem)
+        if cache == "disk":
+            cache = None
+        super().__init__(*args, img_path=img_path, cache=cache, **kwargs)
+
+    def get_img_files(self, img_path):
+        # Virtual paths: only names/keys, nothing is read from them
+        root = Path(img_path).parent / self.shards.split
+        files = [str(root / name) for name in self.shards.names]
+        self._positions = {f: i for i, f in enumerate(files)}
+        count = (self.fraction if isinstance(self.fraction, int)
+                 else max(1, round(len(files) * self.fraction)))
+        return files[:count]
+
+    def get_labels(self):
+        labels = []
+        for f in self.im_files:
+            i = self._positions[f]
+            rec = self.shards.index[i]
+            lab = self.shards.labels(i)
+            labels.append({
+                "im_file": f,
+                "shape": (int(rec["height"]), int(rec["width"])),
+                "cls": lab[:, 0:1].copy(),
+                "bboxes": lab[:, 1:].copy(),
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        if not labels:
+            raise RuntimeError(f"{self.prefix}No images in shard split {self.shards.split}")
+        return labels
+
+    def load_image(self, i, rect_mode=True, resize_short=False):
+        """BaseDataset.load_image, decoding from the shard instead of a file."""
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+
+        im = self.shards.image(self._positions[self.im_files[i]], self.cv2_flag)
+        h0, w0 = im.shape[:2]
+        if rect_mode:
+            r = self.imgsz / (min(h0, w0) if resize_short else max(h0, w0))
+            if r != 1:
+                if resize_short:
+                    w, h = (math.ceil(w0 * r), self.imgsz) if h0 < w0 else (self.imgsz, math.ceil(h0 * r))
+                else:
+                    w, h = min(math.ceil(w0 * r), self.imgsz), min(math.ceil(h0 * r), self.imgsz)
+                im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+        elif not (h0 == w0 == self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        if im.ndim == 2:
+            im = im[..., None]
+
+        # Mosaic buffer, as in BaseDataset
+        if self.augment and self.cache != "ram":
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+
+        return im, (h0, w0), im.shape[:2]
+
+
+def build_shard_dataset(cfg, img_path, batch, data, mode="train", rect=False, stride=32):
+    """build_yolo_dataset for the detect task, returning a ShardYOLODataset."""
+    return ShardYOLODataset(
+        img_path=img_path,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == "train",
+        hyp=cfg,
+        rect=cfg.rect or rect,
+        cache=cfg.cache or None,
+        single_cls=cfg.single_cls or False,
+        stride=stride,
+        pad=0.0 if mode == "train" else 0.5,
+        prefix=colorstr(f"{mode}: "),
+        task=cfg.task,
+        classes=cfg.classes,
+        data=data,
+        fraction=cfg.fraction if mode == "train" else 1.0,
+    )
+
+
+class ShardDetectionTrainer(DetectionTrainer):
+    def build_dataset(self, img_path, mode="train", batch=None):
+        gs = max(int(unwrap_model(self.model).stride.max()), 32)
+        return build_shard_dataset(self.args, img_path, batch, self.data, mode=mode,
+                                   rect=mode == "val", stride=gs)
+
+
+class ShardDetectionValidator(DetectionValidator):
+    def build_dataset(self, img_path, mode="val", batch=None):
+        return build_shard_dataset(self.args, img_path, batch, self.data, mode=mode,
+                                   stride=self.stride)
@@ -6,12 +6,13 @@ Compatible with:
 - ultralytics >= 8.3.0
 """
 
-from ultralytics import YOLO
 import os
-import pandas as pd
 from pathlib import Path
 import glob
 
+import model_registry
+from profiling import StageProfiler, attach_ultralytics_callbacks, record_speed
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -25,17 +26,24 @@ CONF_THRESHOLD = 0.4
 SAVE_IMAGES = False
 OUTPUT_DIR = "test_results"
 
+# Evaluate on packed shards (dataset_shards.py); model.val() decodes the
+# images straight from the memory-mapped shards (shard_ultralytics.py)
+USE_SHARDS = False
+SHARD_DIR = Path("shards")
+
+# Opt-in profiling: timing_test.txt is written into the model's experiment folder
+PROFILE = False
+PROFILE_CPROFILE = False      # Also collect a cProfile of every stage
+PROFILE_TRACEMALLOC = False   # Also track peak memory per stage
+
 # ============================================================================
 # HELPERS
 # ============================================================================
 def load_best_model_info():
-    csv_path = RESULTS_DIR / "validation_metrics.csv"
-    if not csv_path.exists():
+    best = model_registry.best_experiment()
+    if not best:
         return None
 
-    df = pd.read_csv(csv_path)
-    best = df.loc[df["mAP50"].idxmax()]
-
     print("Best model from hyperparameter search:")
     print(
         f"  {best['name']} | "
@@ -49,7 +57,7 @@ def load_best_model_info():
         "name": best["name"],
         "lr0": best["learning_rate"],
         "batch": best["batch_size"],
-        "imgsz": best.get("image_size", 320),
+        "imgsz": best["image_size"],
         "val_mAP50": best["mAP50"],
         "val_precision": best["precision"],
         "val_recall": best["recall"],
@@ -75,32 +83,56 @@ def extract_metrics(results):
 # ============================================================================
 # TESTING
 # ============================================================================
-def test_model(model_path):
+def test_model(model_path, profiler=None, data_yaml=DATA_YAML, imgsz=None):
+    """Evaluate on the test split (at imgsz if given, else the model's own size)."""
+    if profiler is None:
+        profiler = StageProfiler(enabled=False)
+
     print(f"\nLoading model: {model_path}")
-    if not os.path.exists(model_path):
+    if not model_registry.resolve_model_path(model_path).exists():
         print("Model not found.")
         return None
 
-    model = YOLO(model_path)
+    with profiler.stage("model load"):
+        model = model_registry.load_model(model_path)
+    attach_ultralytics_callbacks(model, profiler)
 
-    # Create temporary data.yaml pointing val to test set
-    temp_yaml = "data_test.yaml"
-    with open(DATA_YAML, "r") as f:
-        lines = f.readlines()
+    val_args = {"imgsz": imgsz} if imgsz else {}
+    temp_yaml = None
+    if USE_SHARDS:
+        from shard_ultralytics import ShardDetectionValidator, write_shard_yaml
+        from dataset_shards import ShardDataset
 
-    with open(temp_yaml, "w") as f:
-        for line in lines:
-            if line.strip().startswith("val:"):
-                f.write("val: images/test\n")
-            else:
-                f.write(line)
+        # The shard data.yaml already points val at the test split
+        val_yaml = write_shard_yaml(SHARD_DIR, val_split="test")
+        val_args["validator"] = ShardDetectionValidator
+    else:
+        # Create temporary data.yaml pointing val to test set
+        temp_yaml = val_yaml = "data_test.yaml"
+        with open(data_yaml, "r") as f:
+            lines = f.readlines()
+
+        with open(temp_yaml, "w") as f:
+            for line in lines:
+                if line.strip().startswith("val:"):
+                    f.write("val: images/test\n")
+                else:
+                    f.write(line)
 
     try:
-        results = model.val(
-            data=temp_yaml,
-            conf=CONF_THRESHOLD,
-            verbose=True,
-        )
+        with profiler.stage("model.val (total)"):
+            results = model.val(
+                data=str(val_yaml),
+                conf=CONF_THRESHOLD,
+                verbose=True,
+                **val_args,
+            )
+        if USE_SHARDS:
+            n_images = len(ShardDataset(SHARD_DIR, "test"))
+        else:
+            n_images = len(glob.glob(os.path.join(TEST_DIR, "*.*")))
+        record_speed(profiler, getattr(results, "speed", None), n_images, prefix="test ")
+        profiler.count("test images", n_images)
 
         map50, map5095, precision, recall = extract_metrics(results)
 
@@ -118,7 +150,7 @@ def test_model(model_path):
         }
 
     finally:
-        if os.path.exists(temp_yaml):
+        if temp_yaml and os.path.exists(temp_yaml):
             os.remove(temp_yaml)
 
 # ============================================================================
@@ -128,7 +160,7 @@ def visualize_test_images(model_path):
     if not SAVE_IMAGES:
         return
 
-    model = YOLO(model_path)
+    model = model_registry.load_model(model_path)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     image_paths = []
@@ -165,12 +197,15 @@ def main():
             print("No validation results found. Run train.py first.")
             return
 
-    test_metrics = test_model(best["model_path"])
+    profiler = StageProfiler(PROFILE, PROFILE_CPROFILE, PROFILE_TRACEMALLOC)
+    test_metrics = test_model(best["model_path"], profiler, DATA_YAML)
     if not test_metrics:
         print("Test failed.")
         return
 
     # Save final results
+    import pandas as pd
+
     out_csv = RESULTS_DIR / "test_results.csv"
     df = pd.DataFrame([{
         **best,
@@ -189,7 +224,14 @@ def main():
     print(f"\n✓ Results saved to: {out_csv}")
 
     if SAVE_IMAGES:
-        visualize_test_images(best["model_path"])
+        with profiler.stage("visualize test images"):
+            visualize_test_images(best["model_path"])
+
+    # Report goes next to results.csv of the evaluated experiment
+    exp_dir = model_registry.resolve_model_path(best["model_path"]).parent.parent
+    report_path = profiler.write_report(exp_dir, "test")
+    if report_path:
+        print(f"✓ Timing report: {report_path}")
 
     print("\n✓ Test set was used ONLY for final evaluation.")
 
@@ -17,6 +17,10 @@ import pandas as pd
 from pathlib import Path
 import time
 
+import model_registry
+from shard_ultralytics import ShardDetectionTrainer, write_shard_yaml
+from profiling import StageProfiler, attach_ultralytics_callbacks
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -40,37 +44,80 @@ HYPERPARAMETER_EXPERIMENTS = [
 
 RESULTS_DIR = Path("hyperparameter_results")
 
+# Warm-started search: train one shared warm-up checkpoint from MODEL for
+# WARMUP_EPOCHS, then fork every experiment from it for the remaining
+# EPOCHS - WARMUP_EPOCHS (no LR warm-up again). Off = every experiment
+# trains from MODEL for the full EPOCHS (the original search, and the default).
+WARM_START = False
+WARMUP_EPOCHS = 10
+WARMUP_CONFIG = {"lr0": 0.01, "batch": 4, "name": "shared_warmup"}
+FORK_LR_WARMUP_EPOCHS = 0
+
+# Opt-in ultralytics image cache: "disk" decodes every image once to .npy
+# next to it (inside images/, git-ignored) and later experiments reuse the
+# files; "ram" re-caches per experiment. False = decode on every epoch.
+DATA_CACHE = False
+
+# Train from packed shards (dataset_shards.py) instead of the loose images/
+# folders; images are decoded straight from the memory-mapped shards
+# (shard_ultralytics.py), nothing is unpacked
+USE_SHARDS = False
+SHARD_DIR = Path("shards")
+
+# Opt-in profiling: timing_train.txt is written into each experiment folder
+PROFILE = False
+PROFILE_CPROFILE = False      # Also collect a cProfile of every stage
+PROFILE_TRACEMALLOC = False   # Also track peak memory per stage
+
 # ============================================================================
 # TRAINING + VALIDATION
 # ============================================================================
-def run_experiment(exp_config, exp_id):
+def run_experiment(exp_config, exp_id, data_yaml=DATA_YAML, model_source=None,
+                   epochs=None, imgsz=None, **train_args):
+    """
+    Train one configuration from model_source (MODEL or the shared warm-up
+    checkpoint) and return its result row, or None if it failed.
+    """
+    wall_start = time.perf_counter()
+    warm_start = model_source is not None
+    model_source = model_source if warm_start else MODEL
+    epochs = epochs or EPOCHS
+    imgsz = imgsz or IMGSZ
     print("\n" + "=" * 70)
     print(f"Experiment {exp_id + 1}/{len(HYPERPARAMETER_EXPERIMENTS)}")
     print(f"Name : {exp_config['name']}")
     print(f"LR   : {exp_config['lr0']}")
     print(f"Batch: {exp_config['batch']}")
+    print(f"From : {model_source} ({epochs} epochs)")
     print("=" * 70)
 
-    model = YOLO(MODEL)
+    profiler = StageProfiler(PROFILE, PROFILE_CPROFILE, PROFILE_TRACEMALLOC)
+    with profiler.stage("model load"):
+        model = YOLO(str(model_source))
+    attach_ultralytics_callbacks(model, profiler)
     project_name = f"exp_{exp_id + 1}_{exp_config['name']}"
 
     try:
         # -------------------------------
         # TRAIN (returns metrics in newer versions)
         # -------------------------------
-        results = model.train(
-            data=DATA_YAML,
-            epochs=EPOCHS,
-            imgsz=IMGSZ,
-            batch=exp_config["batch"],
-            lr0=exp_config["lr0"],
-            device=DEVICE,
-            project=str(RESULTS_DIR),
-            name=project_name,
-            save=True,
-            plots=True,
-            verbose=True,
-        )
+        with profiler.stage("model.train (total)"):
+            results = model.train(
+                data=str(data_yaml),
+                epochs=epochs,
+                imgsz=imgsz,
+                batch=exp_config["batch"],
+                lr0=exp_config["lr0"],
+                device=DEVICE,
+                cache=DATA_CACHE,
+                project=str(RESULTS_DIR),
+                name=project_name,
+                save=True,
+                plots=True,
+                verbose=True,
+                trainer=ShardDetectionTrainer if USE_SHARDS else None,
+                **train_args,
+            )
 
         # Get best model path from training results
         exp_dir = RESULTS_DIR / project_name
@@ -101,11 +148,12 @@ def run_experiment(exp_config, exp_id):
         else:
             # Fallback: run validation explicitly
             print("\nRunning explicit validation to collect metrics...")
-            val_results = model.val(
-                data=DATA_YAML,
-                imgsz=IMGSZ,
-                device=DEVICE
-            )
+            with profiler.stage("explicit validation"):
+                val_results = model.val(
+                    data=str(data_yaml),
+                    imgsz=imgsz,
+                    device=DEVICE
+                )
             m = val_results.metrics.box
             map50 = float(m.map50)
             map5095 = float(m.map)
@@ -120,17 +168,25 @@ def run_experiment(exp_config, exp_id):
             f"R: {recall:.4f}"
         )
 
+        report_path = profiler.write_report(exp_dir, "train")
+        if report_path:
+            print(f"✓ Timing report: {report_path}")
+
         return {
             "experiment_id": exp_id + 1,
             "name": exp_config["name"],
             "learning_rate": exp_config["lr0"],
             "batch_size": exp_config["batch"],
-            "image_size": IMGSZ,
+            "image_size": imgsz,
             "mAP50": map50,
             "mAP50_95": map5095,
             "precision": precision,
             "recall": recall,
-            "model_path": str(best_model_path),
+            "model_path": model_registry.normalize_model_path(best_model_path),
+            "warm_start": model_registry.normalize_model_path(model_source)
+                          if warm_start else "",
+            "epochs": epochs,
+            "wall_time_s": round(time.perf_counter() - wall_start, 2),
         }
 
     except Exception as e:
@@ -142,9 +198,48 @@ def run_experiment(exp_config, exp_id):
 # ============================================================================
 # HYPERPARAMETER SEARCH
 # ============================================================================
-def run_hyperparameter_search():
+def train_shared_warmup(data_yaml=DATA_YAML):
+    """
+    Train WARMUP_CONFIG from MODEL for WARMUP_EPOCHS.
+    Returns (last.pt path, seconds); the path is None if training failed.
+    """
+    print("\n" + "=" * 70)
+    print(f"Shared warm-up: {WARMUP_EPOCHS} epochs from {MODEL}")
     print("=" * 70)
-    print("HYPERPARAMETER SEARCH")
+
+    start = time.perf_counter()
+    name = WARMUP_CONFIG["name"]
+    try:
+        YOLO(MODEL).train(
+            data=str(data_yaml),
+            epochs=WARMUP_EPOCHS,
+            imgsz=IMGSZ,
+            batch=WARMUP_CONFIG["batch"],
+            lr0=WARMUP_CONFIG["lr0"],
+            device=DEVICE,
+            cache=DATA_CACHE,
+            project=str(RESULTS_DIR),
+            name=name,
+            exist_ok=True,
+            plots=False,
+            trainer=ShardDetectionTrainer if USE_SHARDS else None,
+        )
+    except Exception as e:
+        print(f"✗ Warm-up failed, experiments start from {MODEL}: {e}")
+        return None, time.perf_counter() - start
+
+    # last.pt, not best.pt: forks continue the run rather than pick a
+    # validation winner after a few epochs
+    checkpoint = RESULTS_DIR / name / "weights" / "last.pt"
+    seconds = time.perf_counter() - start
+    print(f"✓ Warm-up checkpoint: {checkpoint} ({seconds / 60:.1f} minutes)")
+    return checkpoint, seconds
+
+
+def run_hyperparameter_search(data_yaml=DATA_YAML, warm_start=None):
+    warm_start = WARM_START if warm_start is None else warm_start
+    print("=" * 70)
+    print("HYPERPARAMETER SEARCH" + (" (warm-started)" if warm_start else ""))
     print("=" * 70)
 
     RESULTS_DIR.mkdir(exist_ok=True)
@@ -152,13 +247,27 @@ def run_hyperparameter_search():
 
     start_time = time.time()
 
+    checkpoint, warmup_seconds = None, 0.0
+    if warm_start and 0 < WARMUP_EPOCHS < EPOCHS:
+        checkpoint, warmup_seconds = train_shared_warmup(data_yaml)
+
     for i, exp in enumerate(HYPERPARAMETER_EXPERIMENTS):
-        result = run_experiment(exp, i)
+        if checkpoint:
+            result = run_experiment(exp, i, data_yaml, checkpoint, EPOCHS - WARMUP_EPOCHS,
+                                    warmup_epochs=FORK_LR_WARMUP_EPOCHS)
+        else:
+            result = run_experiment(exp, i, data_yaml)
         if result:
             all_results.append(result)
 
+    # Each experiment carries an equal share of the warm-up, so the
+    # wall_time_s + warmup_share_s columns add up to the whole search
+    for result in all_results:
+        result["warmup_share_s"] = round(warmup_seconds / len(all_results), 2)
+
     elapsed_min = (time.time() - start_time) / 60
-    print(f"\nAll experiments finished in {elapsed_min:.1f} minutes")
+    print(f"\nAll experiments finished in {elapsed_min:.1f} minutes"
+          + (f" (shared warm-up: {warmup_seconds / 60:.1f})" if checkpoint else ""))
 
     if not all_results:
         print("No successful experiments.")
@@ -178,20 +287,30 @@ def run_hyperparameter_search():
         f.write(f"Batch Size   : {best['batch_size']}\n")
         f.write(f"mAP50        : {best['mAP50']:.4f}\n")
         f.write(f"Model Path   : {best['model_path']}\n")
+        f.write(f"Warm Start   : {best['warm_start'] or 'no'}\n")
+        f.write(f"Search Time  : {elapsed_min:.1f} minutes\n")
+
+    model_registry.register_experiments(all_results)
 
     print(f"\n✓ Results saved to: {csv_path}")
+    print(f"✓ Model index updated: {model_registry.INDEX_PATH}")
     print(f"✓ Best model: {best['name']} (mAP50: {best['mAP50']:.4f})")
 
 # ============================================================================
 # MAIN
 # ============================================================================
 def main():
-    if not os.path.exists(DATA_YAML):
-        print(f"Error: {DATA_YAML} not found.")
+    data_yaml = DATA_YAML
+    if USE_SHARDS:
+        print(f"Training from shards in {SHARD_DIR}")
+        data_yaml = write_shard_yaml(SHARD_DIR)
+
+    if not os.path.exists(data_yaml):
+        print(f"Error: {data_yaml} not found.")
         return
 
     if HYPERPARAMETER_SEARCH:
-        run_hyperparameter_search()
+        run_hyperparameter_search(data_yaml)
     else:
         print("Single-run mode disabled in this configuration.")
 
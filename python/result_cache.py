@@ -0,0 +1,246 @@
+import os
+import sys
+import pickle
+import hashlib
+import inspect
+import tempfile
+from pathlib import Path
+
+# ===== Configuration =====
+CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "results"
+MAX_BYTES = 256 * 1024 * 1024  # LRU size cap for the whole cache directory
+EVICT_TO = 0.9  # Evict down to this fraction of MAX_BYTES
+CACHE_VERSION = 1  # Bump to invalidate every entry (e.g. after a library upgrade)
+# ===== End Configuration =====
+
+# Content-addressed cache for per-image preprocessing results.
+# An entry is keyed by SHA-256 over the function's qualified name and code,
+# the content of every argument (image pixels, not file names) and the
+# keyword parameters. The code part covers bytecode and constants, plus the
+# module globals the function reads: scalars (e.g. q3.WEIGHT_BITS), and
+# same-module helpers, whether called directly or held in a tuple, list
+# or dict (e.g. the kernels in q3.RESAMPLE_LUTS), recursively. Editing
+# the function or any helper it can reach that way invalidates its
+# entries; helpers from other modules and other objects are not tracked.
+# Re-runs over unchanged images skip the computation even across scripts
+# and processes. Entries are pickles written atomically (temp file +
+# os.replace); hits refresh the file mtime, and the oldest files are
+# evicted once the directory grows past MAX_BYTES.
+
+
+def _is_instance(obj, module, name):
+    # numpy/PIL are only checked when the caller already imported them
+    mod = sys.modules.get(module)
+    return mod is not None and isinstance(obj, getattr(mod, name))
+
+
+def _func_name(func):
+    # Scripts run as __main__ still share entries with importers
+    module = func.__module__
+    if module == "__main__":
+        try:
+            module = Path(inspect.getsourcefile(func)).stem
+        except TypeError:
+            pass
+    return f"{module}.{func.__qualname__}"
+
+
+def _update_code_digest(h, func, seen):
+    """Feed func's code and the globals it reads (_update_global_digest) into h."""
+    if func in seen:
+        return
+    seen.add(func)
+    glb = getattr(func, "__globals__", {})
+    stack = [func.__code__]
+    names = []
+    while stack:
+        code = stack.pop()
+        h.update(code.co_code)
+        names.extend(code.co_names)
+        for const in code.co_consts:
+            if inspect.iscode(const):
+                stack.append(const)  # Nested functions, lambdas, comprehensions
+            else:
+                h.update(repr(const).encode())
+
+    for name in sorted(set(names)):
+        if name in glb:
+            h.update(f"g{name}=".encode())
+            _update_global_digest(h, glb[name], func.__module__, seen)
+
+
+def _update_global_digest(h, value, module, seen):
+    """
+    Feed a global into h: scalars by value, functions of `module` by code,
+    and tuples/lists/dicts by their items (a dispatch table of kernels
+    counts as code). Anything else only adds its type name.
+    """
+    if inspect.isfunction(value):
+        h.update(f"f{value.__module__}.{value.__qualname__};".encode())
+        if value.__module__ == module:
+            _update_code_digest(h, value, seen)
+    elif value is None or isinstance(value, (bool, int, float, str, bytes)):
+        h.update(f"s{value!r};".encode())
+    elif isinstance(value, (tuple, list)):
+        h.update(b"l%d:" % len(value))
+        for item in value:
+            _update_global_digest(h, item, module, seen)
+    elif isinstance(value, dict):
+        h.update(b"d%d:" % len(value))
+        for k in sorted(value, key=repr):
+            _update_global_digest(h, k, module, seen)
+            _update_global_digest(h, value[k], module, seen)
+    else:
+        h.update(f"o{type(value).__name__};".encode())
+
+
+def _update_digest(h, obj):
+    """Feed the content of obj into hash h (type-tagged, so 1 != '1')."""
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        h.update(b"b%d:" % len(obj))
+        h.update(obj)
+    elif _is_instance(obj, "numpy", "ndarray"):
+        h.update(f"a{obj.dtype.str}{obj.shape}:".encode())
+        h.update(obj.tobytes())
+    elif _is_instance(obj, "PIL.Image", "Image"):
+        h.update(f"i{obj.mode}{obj.size}:".encode())
+        h.update(obj.tobytes())
+    elif isinstance(obj, (list, tuple)):
+        # Rows of pixel values (q1 grayscale lists) hash as bytes when possible
+        if obj and all(isinstance(v, int) and 0 <= v < 256 for v in obj):
+            h.update(b"r%d:" % len(obj))
+            h.update(bytes(obj))
+        else:
+            h.update(b"l%d:" % len(obj))
+            for item in obj:
+                _update_digest(h, item)
+    elif isinstance(obj, dict):
+        h.update(b"d%d:" % len(obj))
+        for k in sorted(obj):
+            _update_digest(h, k)
+            _update_digest(h, obj[k])
+    elif obj is None or isinstance(obj, (bool, int, float, str)):
+        h.update(f"s{type(obj).__name__}:{obj!r};".encode())
+    else:
+        raise TypeError(f"Cannot hash {type(obj).__name__} for the result cache")
+
+
+def cache_key(func, args=(), kwargs=None):
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}:{_func_name(func)};".encode())
+    _update_code_digest(h, func, set())
+    _update_digest(h, tuple(args))
+    _update_digest(h, kwargs or {})
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    cache = ResultCache()
+    binary, threshold = cache.call(extract_bright_pixels_histogram, gray, max_pixels=1000)
+    """
+
+    def __init__(self, root=None, max_bytes=None, enabled=True):
+        self.root = Path(root or CACHE_DIR)
+        self.max_bytes = max_bytes or MAX_BYTES
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # Bytes on disk, scanned lazily
+
+    def _path(self, key):
+        return self.root / key[:2] / f"{key}.pkl"
+
+    def get(self, key):
+        """Return (True, value) on a hit, (False, None) otherwise."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except Exception:
+            # Missing, truncated or unloadable (e.g. a class that moved):
+            # a miss, and put() overwrites the entry
+            return False, None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return True, value
+
+    def put(self, key, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # Atomic: readers see either no file or the complete file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+        if self._size is None:
+            self._size = self.disk_usage()
+        else:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def call(self, func, *args, **kwargs):
+        """func(*args, **kwargs), served from the cache when possible."""
+        if not self.enabled:
+            return func(*args, **kwargs)
+
+        key = cache_key(func, args, kwargs)
+        hit, value = self.get(key)
+        if hit:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = func(*args, **kwargs)
+        self.put(key, value)
+        return value
+
+    # ----- Size management -----
+    def _entries(self):
+        entries = []
+        for path in self.root.glob("*/*.pkl"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue  # Evicted by another process
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, target=None):
+        """Delete least recently used entries until usage <= target bytes."""
+        if target is None:
+            target = int(self.max_bytes * EVICT_TO)
+        entries = sorted(self._entries())
+        size = sum(s for _, s, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            size -= entry_size
+        self._size = size
+        return size
+
+    def clear(self):
+        self.evict(target=0)
+
+    def summary(self):
+        return f"cache: {self.hits} hits, {self.misses} misses ({self.root})"